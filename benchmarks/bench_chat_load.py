@@ -0,0 +1,139 @@
+"""
+聊天插件的离线压测: 启动本地模拟的流式补全服务, 让大量模拟会话并发调用`Chat.get_session(...).chat(...)`
+
+用法: `python -m benchmarks.bench_chat_load [--sessions 200] [--rounds 3] ...`
+- 报告吞吐量、首字延迟、p50/p99 总延迟与每个会话的内存占用
+- 只连接本机的模拟服务, 不需要网络, 也不消耗真实的额度
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import time
+import tracemalloc
+from typing import Dict, List
+
+from benchmarks.mock_openai import MockOpenAIServer
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _load_chat(args: argparse.Namespace, base_url: str):
+    """以压测配置初始化 nonebot 并载入聊天插件"""
+    import nonebot
+
+    nonebot.init(
+        driver="~none",
+        siliconflow_api_key="mock",
+        chat_base_url=base_url,
+        chat_backends=[],
+        chat_max_concurrency=args.concurrency,
+        chat_queue_deadline=args.deadline,
+        chat_chunk_event_interval=0,
+        chat_history_summary=False,
+        chat_stream_reply=False,
+    )
+    nonebot.load_plugin("src.plugins.chat")
+    from src.plugins.chat.chat import Chat
+    from src.plugins.chat.client import ClientPool
+
+    ClientPool.configure(
+        max_connections=args.connections,
+        max_keepalive_connections=args.connections,
+        keepalive_expiry=60.0,
+        timeout=120.0,
+    )
+    return Chat
+
+
+async def _run_sessions(Chat, prefix: str, args: argparse.Namespace) -> Dict[str, List[float]]:
+    """每个会话依次发送`rounds`条消息, 所有会话并发"""
+    started: Dict[str, float] = {}
+    ttft: List[float] = []
+    latency: List[float] = []
+
+    @Chat.on_response_chunk.add_handler
+    async def _first_chunk(session_id: str, chunk: str, builder):
+        start = started.pop(session_id, None)
+        if start is not None:
+            ttft.append(time.perf_counter() - start)
+
+    async def session(index: int):
+        session_id = f"{prefix}{index}"
+        chat = Chat.get_session(session_id, "group")["chat"]
+        for round in range(args.rounds):
+            start = started[session_id] = time.perf_counter()
+            await chat.chat(f"第{round}条消息", f"user{index}")
+            latency.append(time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(session(i) for i in range(args.sessions)))
+    finally:
+        Chat.on_response_chunk.handlers.remove(_first_chunk)
+    return {"ttft": ttft, "latency": latency}
+
+
+async def main(args: argparse.Namespace):
+    # 避免本机请求被环境变量中的代理转发
+    os.environ["NO_PROXY"] = os.environ["no_proxy"] = "127.0.0.1,localhost"
+    async with MockOpenAIServer(
+        latency=args.latency, token_rate=args.token_rate, tokens=args.tokens
+    ) as server:
+        Chat = _load_chat(args, server.base_url)
+        print(
+            f"会话: {args.sessions}, 每个会话 {args.rounds} 轮, 并发上限: {args.concurrency}, "
+            f"首字延迟: {args.latency}s, 输出速度: {args.token_rate} token/s"
+        )
+
+        start = time.perf_counter()
+        result = await _run_sessions(Chat, "load", args)
+        elapsed = time.perf_counter() - start
+        requests = len(result["latency"])
+        print(f"\n{'总耗时':<16}{elapsed:>10.2f} s")
+        print(f"{'吞吐量':<16}{requests / elapsed:>10.2f} 请求/s")
+        print(f"{'输出速度':<16}{requests * args.tokens / elapsed:>10.1f} token/s")
+        print(f"{'上游最大并发':<14}{server.max_active:>10}")
+        for name in ("ttft", "latency"):
+            samples = result[name]
+            print(
+                f"{name:<16}p50 {_percentile(samples, 0.5) * 1000:>8.1f} ms"
+                f"  p99 {_percentile(samples, 0.99) * 1000:>8.1f} ms"
+            )
+
+        # 内存单独测量, 避免 tracemalloc 的开销影响上面的延迟数据
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        await _run_sessions(Chat, "memory", args)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{'每个会话内存':<14}{(after - before) / args.sessions / 1024:>10.1f} KiB")
+
+        await Chat.cancel_all_tasks()
+        from src.plugins.chat.client import ClientPool
+
+        await ClientPool.close_all()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="聊天插件离线压测")
+    parser.add_argument("--sessions", type=int, default=200, help="模拟的会话数")
+    parser.add_argument("--rounds", type=int, default=3, help="每个会话发送的消息数")
+    parser.add_argument("--concurrency", type=int, default=8, help="上游并发上限")
+    parser.add_argument("--connections", type=int, default=64, help="客户端连接数上限")
+    parser.add_argument("--deadline", type=float, default=600.0, help="排队超时(秒)")
+    parser.add_argument("--latency", type=float, default=0.3, help="模拟首字延迟(秒)")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="模拟输出速度(token/s)")
+    parser.add_argument("--tokens", type=int, default=40, help="每次回复的 token 数")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,130 @@
+"""
+命令解析与分发的微基准: `Command.__init__` 与 `Command.run` 的分发开销
+
+用法: `python -m benchmarks.bench_command [N]`
+对比 按别名线性查找(旧实现) 与 索引查找, 以及 每次匹配字符串正则 与 预编译正则
+"""
+
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from nonebot.adapters.onebot.v11.message import Message, MessageSegment
+
+MESSAGES = [
+    "/d 2d6+3",
+    "/cal@c 100USD>CNY",
+    "/sx yyds",
+    "/holidays",
+    "/拷打@加入",
+    "/bombDisposal@开始",
+]
+
+
+def _bench(label: str, func, n: int, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<36}{best / n * 1e6:>10.3f} us/次")
+    return best
+
+
+def _load_command():
+    """在临时目录中初始化 nonebot 并载入命令插件, 汇率接口使用占位的密钥"""
+    import nonebot
+
+    nonebot.init(driver="~none")
+    workdir = tempfile.mkdtemp(prefix="erin-bench-")
+    os.makedirs(os.path.join(workdir, "erin", "data"))
+    os.chdir(workdir)
+
+    from src.data.data import DataManager
+
+    DataManager.set("forexrate_api_key", "mock")
+    nonebot.load_plugin("src.plugins.command")
+    from src.plugins.command.scr.command import Command, CommandStrategy
+
+    return Command, CommandStrategy
+
+
+def _linear_get_command(CommandStrategy, command: str):
+    """旧实现: 先查命令名, 再逐个扫描所有命令的别名"""
+    item = CommandStrategy.Command_Map.get(command)
+    if item:
+        return command, item
+    for name, item in CommandStrategy.Command_Map.items():
+        if command in item["tags"]:
+            return name, item
+
+
+def main(n: int = 100000):
+    Command, CommandStrategy = _load_command()
+    names = [Command.Command_Pattern.match(m).group(1) for m in MESSAGES]  # type: ignore
+    pattern = Command.Command_Pattern.pattern
+
+    print(f"N = {n}\n")
+    print("[命令查找]")
+    linear = _bench(
+        "线性扫描别名", lambda: [_linear_get_command(CommandStrategy, c) for _ in range(n // len(names)) for c in names], n
+    )
+    indexed = _bench(
+        "索引查找", lambda: [CommandStrategy.get_command(c) for _ in range(n // len(names)) for c in names], n
+    )
+    print(f"{'加速比':<34}{linear / indexed:>10.1f} x")
+
+    print("\n[命令解析]")
+    _bench(
+        "re.match(字符串正则)",
+        lambda: [re.match(pattern, m) for _ in range(n // len(MESSAGES)) for m in MESSAGES],
+        n,
+    )
+    _bench(
+        "预编译正则",
+        lambda: [Command.Command_Pattern.match(m) for _ in range(n // len(MESSAGES)) for m in MESSAGES],
+        n,
+    )
+
+    events = [
+        SimpleNamespace(
+            original_message=Message(m) + MessageSegment.at(10000), message_type="group"
+        )
+        for m in MESSAGES
+    ]
+    print("\n[Command]")
+    _bench(
+        "Command.__init__",
+        lambda: [Command(None, e) for _ in range(n // len(events)) for e in events],  # type: ignore
+        n,
+    )
+
+    async def noop(cmd: Command):
+        return None
+
+    # 把所有命令的处理函数替换为空操作, 只测量分发本身
+    original = {name: item["strategy"] for name, item in CommandStrategy.Command_Map.items()}
+    for item in CommandStrategy.Command_Map.values():
+        item["strategy"] = noop
+    commands = [Command(None, e) for e in events]  # type: ignore
+    loop = asyncio.new_event_loop()
+
+    async def run_all():
+        for _ in range(n // len(commands)):
+            for cmd in commands:
+                await cmd.run()
+
+    try:
+        _bench("Command.run (分发)", lambda: loop.run_until_complete(run_all()), n)
+    finally:
+        for name, strategy in original.items():
+            CommandStrategy.Command_Map[name]["strategy"] = strategy
+        loop.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,58 @@
+"""
+DataManager 批量写入的微基准: N 次单键写入(每次都写回) 对比 一次批量写入
+
+用法: `python -m benchmarks.bench_data_batch [N]`
+在临时目录中运行, 不会修改`erin/data`中的数据
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+
+def _bench(label: str, func, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<32}{best * 1000:>10.2f} ms")
+    return best
+
+
+def main(n: int = 200):
+    workdir = tempfile.mkdtemp(prefix="erin-bench-")
+    os.makedirs(os.path.join(workdir, "erin", "data"))
+    os.chdir(workdir)
+
+    from src.data.data import DataManager, create_backend
+
+    value = {"score": 100, "players": ["a", "b", "c"], "round": 3}
+
+    def single_sets():
+        for i in range(n):
+            DataManager.set(f"bench:{i}", value)
+            DataManager.flush()
+
+    def batched_set():
+        with DataManager.batch() as batch:
+            for i in range(n):
+                batch.set(f"bench:{i}", value)
+
+    def set_many():
+        DataManager.set_many({f"bench:{i}": value for i in range(n)})
+        DataManager.flush()
+
+    print(f"N = {n}, 工作目录: {workdir}")
+    for name in ("pickledb", "journal", "sqlite"):
+        DataManager.use_backend(create_backend(name))
+        print(f"\n[{name}]")
+        single = _bench(f"{n} x set + flush", single_sets)
+        batch = _bench("batch() x 1", batched_set)
+        _bench("set_many + flush", set_many)
+        print(f"{'加速比':<30}{single / batch:>10.1f} x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,174 @@
+"""
+本地模拟的 OpenAI 兼容接口, 只实现`POST /v1/chat/completions`(含流式输出), 供离线压测使用
+
+用法: `python -m benchmarks.mock_openai [端口]`
+- 首字延迟(`latency`)与输出速度(`token_rate`)可配置
+- 只监听本机地址, 不访问网络
+"""
+
+import asyncio
+import json
+import sys
+import time
+
+
+class MockOpenAIServer:
+    """
+    ### 模拟的流式补全服务
+    - latency: 收到请求到输出第一个 token 的时间(秒)
+    - token_rate: 每秒输出的 token 数
+    - tokens: 每次回复的 token 数
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.3,
+        token_rate: float = 50.0,
+        tokens: int = 40,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.requests = 0
+        """收到的补全请求数"""
+        self.active = 0
+        """正在输出的请求数"""
+        self.max_active = 0
+        self._server: asyncio.Server | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            # 关闭空闲的 keep-alive 连接, 让连接处理任务退出
+            for writer in list(self._writers):
+                writer.close()
+            while self._writers:
+                await asyncio.sleep(0.01)
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            # 支持 keep-alive, 同一连接上依次处理多个请求
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    await self._completion(writer, json.loads(body or b"{}"))
+                else:
+                    self._write_response(writer, 404, b'{"error": "not found"}')
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _write_response(self, writer: asyncio.StreamWriter, status: int, body: bytes):
+        writer.write(
+            f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+
+    async def _completion(self, writer: asyncio.StreamWriter, request: dict):
+        self.requests += 1
+        model = request.get("model", "mock")
+        tokens = [f"字{i}" for i in range(self.tokens - 1)] + ["。"]
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+            if not request.get("stream"):
+                await asyncio.sleep(len(tokens) / self.token_rate)
+                body = {
+                    "id": "mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "".join(tokens)},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                }
+                self._write_response(writer, 200, json.dumps(body).encode())
+                return
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                b"Transfer-Encoding: chunked\r\n\r\n"
+            )
+            interval = 1 / self.token_rate
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(interval)
+                chunk = {
+                    "id": "mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": token},
+                            "finish_reason": "stop" if i == len(tokens) - 1 else None,
+                        }
+                    ],
+                }
+                self._write_event(writer, json.dumps(chunk, ensure_ascii=False))
+                await writer.drain()
+            self._write_event(writer, "[DONE]")
+            writer.write(b"0\r\n\r\n")
+        finally:
+            self.active -= 1
+
+    def _write_event(self, writer: asyncio.StreamWriter, data: str):
+        payload = f"data: {data}\n\n".encode("utf-8")
+        writer.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+
+
+async def _serve(port: int):
+    async with MockOpenAIServer(port=port) as server:
+        print(f"模拟服务已启动: {server.base_url}")
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(_serve(int(sys.argv[1]) if len(sys.argv) > 1 else 8000))
@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Final, Iterable
+
+from pickledb import PickleDB
+
+from src.data.cache import MISSING
+
+
+REMOVED: Final = object()
+"""写入批次中表示删除该键的标记"""
+
+
+class StorageBackend(ABC):
+    """
+    ### DataManager 的存储引擎接口
+    所有方法都可能在写回线程中被调用, 实现需要自行保证线程安全
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """读取一个键, 不存在时返回`MISSING`"""
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        """读取多个键, 结果中只包含存在的键"""
+        result = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not MISSING:
+                result[key] = value
+        return result
+
+    @abstractmethod
+    def scan(self, prefix: str) -> dict[str, Any]:
+        """读取所有以`prefix`开头的键"""
+
+    @abstractmethod
+    def write_batch(self, changes: dict[str, Any]) -> None:
+        """
+        原子地写入一批修改
+        - changes: 键 -> 新值, 值为`REMOVED`时删除该键
+        """
+
+    def is_empty(self) -> bool:
+        return not self.scan("")
+
+    def close(self) -> None:
+        pass
+
+
+class PickleDBBackend(StorageBackend):
+    """整个数据库保存为单个JSON文件, 全部载入内存, 每次写入时整体原子替换文件"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._db = PickleDB(path)
+        self._lock = threading.Lock()
+        """保护内存中的数据"""
+        self._write_lock = threading.Lock()
+        """保证快照按顺序写入文件"""
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            value = self._db.get(key)
+        # pickledb 对不存在的键返回 None(旧版本为 False)
+        return MISSING if value is None or value is False else value
+
+    def scan(self, prefix: str) -> dict[str, Any]:
+        with self._lock:
+            return {
+                key: self._db.get(key)
+                for key in self._db.all()
+                if key.startswith(prefix)
+            }
+
+    def write_batch(self, changes: dict[str, Any]) -> None:
+        with self._write_lock:
+            with self._lock:
+                for key, value in changes.items():
+                    if value is REMOVED:
+                        self._db.remove(key)
+                    else:
+                        self._db.set(key, value)
+                snapshot = {key: self._db.get(key) for key in self._db.all()}
+            atomic_write(self.path, json.dumps(snapshot, ensure_ascii=False))
+
+
+def atomic_write(path: str, data: str) -> None:
+    """以 临时文件 + 原子重命名 的方式替换文件内容"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
@@ -0,0 +1,112 @@
+import heapq
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Final, NamedTuple
+
+
+MISSING: Final = object()
+"""缓存未命中时的哨兵值"""
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    expire_at: float | None
+
+
+def estimate_size(value: Any) -> int:
+    """估算值占用的字节数, 以其JSON序列化后的长度为准"""
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class LRUCache:
+    """
+    ### 有界 LRU 缓存
+    - 同时限制条目数量与估算的总字节数, 超出时淘汰最久未使用的条目
+    - 每个键可以有独立的过期时间, 过期时间保存在最小堆中, 每次访问时只需弹出堆顶已过期的条目
+    """
+
+    def __init__(self, max_items: int = 1024, max_bytes: int = 8 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._expiry_heap: list[tuple[float, str]] = []
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not MISSING
+
+    @property
+    def size(self) -> int:
+        """当前缓存条目的估算总字节数"""
+        return self._bytes
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        self.purge_expired()
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def set(self, key: str, value: Any, expire_at: float | None = None):
+        """
+        写入缓存
+        - expire_at: 过期的时间戳(`time.time()`), `None`表示不过期
+        """
+        self.pop(key)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            # 单个值超过缓存上限时不缓存
+            return
+        self._entries[key] = _Entry(value, size, expire_at)
+        self._bytes += size
+        if expire_at is not None:
+            heapq.heappush(self._expiry_heap, (expire_at, key))
+        self.purge_expired()
+        self._evict()
+
+    def pop(self, key: str, default: Any = MISSING) -> Any:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self._bytes -= entry.size
+        return entry.value
+
+    def clear(self):
+        self._entries.clear()
+        self._expiry_heap.clear()
+        self._bytes = 0
+
+    def purge_expired(self, now: float | None = None):
+        """移除所有已过期的条目"""
+        now = time.time() if now is None else now
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expire_at, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            # 堆中的记录可能已被覆盖写入, 仅当过期时间一致时才移除
+            if entry is not None and entry.expire_at == expire_at:
+                self.pop(key)
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_items or self._bytes > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+        if len(self._expiry_heap) > 2 * len(self._entries) + 64:
+            # 堆中积累了过多失效的记录时重建
+            self._expiry_heap = [
+                (entry.expire_at, key)
+                for key, entry in self._entries.items()
+                if entry.expire_at is not None
+            ]
+            heapq.heapify(self._expiry_heap)
@@ -1,60 +1,516 @@
-from pickledb import PickleDB
-from decorator import decorator
-
 import asyncio
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from typing import Any
+import nonebot
+from nonebot.log import logger
 
+from typing import Any, Callable, Iterable
 
-class DataManager:
-    __cache = {}
-    __db = PickleDB("erin/data/data.db")
-    __last_update: float = 0
+from src.data.backend import StorageBackend, PickleDBBackend, REMOVED
+from src.data.cache import LRUCache, MISSING
 
-    @decorator
-    @staticmethod
-    def __update_last_update(func, *args, **kw):
-        result = func(*args, **kw)
-        DataManager.__last_update = time.time()
-        return result
 
-    async def _data_cache_control(self):
-        while True:
-            await asyncio.sleep(60)
-            if self.__last_update == 0:
-                self.__last_update = time.time()
-            else:
-                if time.time() - self.__last_update > 60:
-                    self.__cache.clear()
-                    self.__last_update = time.time()
+DB_PATH = "erin/data/data.db"
+SQLITE_PATH = "erin/data/data.sqlite3"
 
-    def __init__(self) -> None:
-        asyncio.get_event_loop().create_task(self._data_cache_control())
+_NOT_LOCAL = object()
+"""键不在尚未写回的修改中"""
+
+EXPIRES_PREFIX = "__expires__:"
+"""保存过期时间的保留键前缀, 每个键单独保存: `__expires__:<键>` -> 过期时间戳"""
+_LEGACY_EXPIRES_KEY = "__expires__"
+"""旧版本把所有键的过期时间保存在同一个键中"""
+
+try:
+    _driver = nonebot.get_driver()
+except ValueError:
+    # nonebot 未初始化(如独立脚本中使用), 由调用方自行调用`DataManager.flush`
+    _driver = None
+
+
+def create_backend(name: str | None = None) -> StorageBackend:
+    """
+    按名称创建存储引擎, 默认读取配置项`DATA_BACKEND`
+    - `pickledb`: 单个JSON文件(默认)
+    - `sqlite`: SQLite(WAL), 首次使用时自动导入`erin/data/data.db`中的数据
+    - `journal`: 以`erin/data/data.db`为快照, 修改追加到日志文件并在后台压缩
+    """
+    if name is None:
+        name = getattr(_driver.config, "data_backend", None) if _driver else None
+    name = (name or "pickledb").lower()
+    if name == "sqlite":
+        from src.data.sqlite_backend import SQLiteBackend
+        from src.data.migrate import migrate_json_file
+
+        backend = SQLiteBackend(SQLITE_PATH)
+        if backend.is_empty() and os.path.exists(DB_PATH):
+            count = migrate_json_file(DB_PATH, backend)
+            logger.info(f"已从 {DB_PATH} 导入 {count} 个键到 SQLite")
+        return backend
+    if name == "journal":
+        from src.data.journal_backend import JournalBackend
+
+        return JournalBackend(DB_PATH)
+    if name == "pickledb":
+        return PickleDBBackend(DB_PATH)
+    raise ValueError(f"未知的存储引擎: {name}")
+
+
+def load_expires(backend: StorageBackend) -> dict[str, float]:
+    """读取所有键的过期时间, 旧版本的过期时间表在此时一次性拆分为单独的键"""
+    expires = {
+        key[len(EXPIRES_PREFIX) :]: expire_at
+        for key, expire_at in backend.scan(EXPIRES_PREFIX).items()
+    }
+    legacy = backend.get(_LEGACY_EXPIRES_KEY)
+    if legacy is not MISSING:
+        changes: dict[str, Any] = {
+            EXPIRES_PREFIX + key: expire_at
+            for key, expire_at in legacy.items()
+            if key not in expires
+        }
+        changes[_LEGACY_EXPIRES_KEY] = REMOVED
+        backend.write_batch(changes)
+        expires = {**legacy, **expires}
+    return expires
+
+
+class DataManager:
+    FLUSH_INTERVAL: float = 5.0
+    """定时写回的间隔(秒)"""
+    FLUSH_THRESHOLD: int = 32
+    """脏键数量达到该值时立即触发一次写回"""
+    CACHE_MAX_ITEMS: int = 1024
+    """缓存的最大条目数"""
+    CACHE_MAX_BYTES: int = 8 * 1024 * 1024
+    """缓存的最大估算字节数"""
+
+    __backend: StorageBackend = create_backend()
+    __cache = LRUCache(CACHE_MAX_ITEMS, CACHE_MAX_BYTES)
+    __expires: dict[str, float] = load_expires(__backend)
+    """键 -> 过期时间戳, 以`EXPIRES_PREFIX`开头的保留键随数据一起持久化"""
+    __pending: dict[str, Any] = {}
+    """写回缓冲: 已修改但尚未写回的键 -> 新值(删除为`REMOVED`)"""
+    __flushing: dict[str, Any] = {}
+    """正在写回中的修改, 写入完成前读取仍以它为准"""
+    __flush_task: asyncio.Task | None = None
+    __flush_loop_task: asyncio.Task | None = None
+    __write_task: asyncio.Task | None = None
+    """最近一次异步写回, 关闭时等待它完成"""
+    __flush_lock = asyncio.Lock()
+    """保证同一时间只有一个批次在写回"""
+    __executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="erin-data")
+    """存储引擎专用的单线程, 异步读取与写回都在其中按提交顺序执行"""
+    __generation: int = 0
+    """每次写入递增, 用于判断异步读取期间是否发生了写入"""
+
+    @classmethod
+    def use_backend(cls, backend: StorageBackend):
+        """切换存储引擎, 切换前写回所有修改"""
+        cls.flush()
+        cls.__backend.close()
+        cls.__backend = backend
+        cls.__cache.clear()
+        cls.__expires = load_expires(backend)
 
     @classmethod
-    @__update_last_update
     def get(cls, key: str, default: Any | None = None):
-        if key in cls.__cache:
-            return cls.__cache[key]
-        else:
-            cls.__db = PickleDB("erin/data/data.db")
-            value = cls.__db.get(key)
-            if value == False:
-                if default is None:
-                    raise KeyError(f"Key {key} not found in database.")
-                else:
-                    return default
+        value = cls.__cache.get(key)
+        if value is not MISSING:
             return value
+        if cls.__is_expired(key):
+            cls.remove(key)
+            value = MISSING
+        else:
+            value = cls.__lookup(key)
+        if value is not MISSING:
+            cls.__cache.set(key, value, cls.__expires.get(key))
+        return cls.__resolve(key, value, default)
 
     @classmethod
-    @__update_last_update
-    def set(cls, key: str, value: Any):
-        cls.__cache[key] = value
-        cls.__db.set(key, value)
+    def set(cls, key: str, value: Any, ttl: float | None = None):
+        """
+        写入数据
+        - ttl: 数据的有效期(秒), 过期后`get`将视为不存在, `None`表示永不过期
+        """
+        cls.__write([(key, value, ttl)])
 
     @classmethod
-    @__update_last_update
     def remove(cls, key: str):
-        cls.__cache.pop(key, None)
-        cls.__db.remove(key)
+        cls.__write([(key, REMOVED, None)])
+
+    @classmethod
+    def get_many(cls, keys: Iterable[str]) -> dict[str, Any]:
+        """读取多个键, 未命中缓存的键只访问一次存储引擎, 结果中只包含存在的键"""
+        result: dict[str, Any] = {}
+        misses: list[str] = []
+        for key in keys:
+            value = cls.__cache.get(key)
+            if value is MISSING and not cls.__is_expired(key):
+                value = cls.__lookup_local(key)
+                if value is _NOT_LOCAL:
+                    misses.append(key)
+                    continue
+            if value is not MISSING:
+                result[key] = value
+        if misses:
+            loaded = cls.__backend.get_many(misses)
+            for key, value in loaded.items():
+                cls.__cache.set(key, value, cls.__expires.get(key))
+            result.update(loaded)
+        return result
+
+    @classmethod
+    def set_many(cls, items: dict[str, Any], ttl: float | None = None):
+        """写入多个键, 所有键使用相同的有效期"""
+        cls.__write([(key, value, ttl) for key, value in items.items()])
+
+    @classmethod
+    def remove_many(cls, keys: Iterable[str]):
+        cls.__write([(key, REMOVED, None) for key in keys])
+
+    @classmethod
+    def batch(cls) -> "DataBatch":
+        """
+        ### 批量修改
+        上下文中的修改暂存在批次中, 正常退出时一次性提交并只进行一次写回, 出现异常时全部丢弃
+
+        ```python
+        with DataManager.batch() as batch:
+            batch.set("game:<guild>:state", state)
+            batch.remove("game:<guild>:players")
+        ```
+        在异步代码中使用`async with`, 写回在存储线程中进行
+        """
+        return DataBatch()
+
+    @classmethod
+    def _commit_batch(cls, changes: list[tuple[str, Any, float | None]]):
+        cls.__write(changes, schedule=False)
+
+    @classmethod
+    async def aget(cls, key: str, default: Any | None = None):
+        """`get`的异步版本, 缓存命中时直接返回, 否则在存储线程中读取"""
+        value = cls.__cache.get(key)
+        if value is not MISSING:
+            return value
+        if cls.__is_expired(key):
+            await cls.aremove(key)
+            value = MISSING
+        else:
+            value = cls.__lookup_local(key)
+            if value is _NOT_LOCAL:
+                generation = cls.__generation
+                value = await cls.__run(cls.__backend.get, key)
+                if generation != cls.__generation:
+                    # 读取期间发生了写入, 以内存中较新的值为准, 且不用可能过时的值填充缓存
+                    local = cls.__lookup_local(key)
+                    if local is not _NOT_LOCAL:
+                        value = local
+                    return cls.__resolve(key, value, default)
+        if value is not MISSING:
+            cls.__cache.set(key, value, cls.__expires.get(key))
+        return cls.__resolve(key, value, default)
+
+    @classmethod
+    async def aget_many(cls, keys: Iterable[str]) -> dict[str, Any]:
+        """异步读取多个键, 未命中缓存的键在一次存储线程调用中读取, 结果中只包含存在的键"""
+        result: dict[str, Any] = {}
+        misses: list[str] = []
+        for key in keys:
+            value = cls.__cache.get(key)
+            if value is MISSING and not cls.__is_expired(key):
+                local = cls.__lookup_local(key)
+                if local is _NOT_LOCAL:
+                    misses.append(key)
+                    continue
+                value = local
+            if value is not MISSING:
+                result[key] = value
+        if misses:
+            generation = cls.__generation
+            loaded = await cls.__run(cls.__backend.get_many, misses)
+            fresh = generation == cls.__generation
+            for key in misses:
+                local = _NOT_LOCAL if fresh else cls.__lookup_local(key)
+                value = local if local is not _NOT_LOCAL else loaded.get(key, MISSING)
+                if value is MISSING:
+                    continue
+                result[key] = value
+                if fresh:
+                    cls.__cache.set(key, value, cls.__expires.get(key))
+        return result
+
+    @classmethod
+    async def aset(cls, key: str, value: Any, ttl: float | None = None):
+        """`set`的异步版本, 写回缓冲达到阈值时等待这一批写回完成"""
+        cls.set(key, value, ttl)
+        await cls.__wait_threshold()
+
+    @classmethod
+    async def aremove(cls, key: str):
+        """`remove`的异步版本, 写回缓冲达到阈值时等待这一批写回完成"""
+        cls.remove(key)
+        await cls.__wait_threshold()
+
+    @classmethod
+    def scan(cls, prefix: str) -> dict[str, Any]:
+        """获取所有以`prefix`开头的键值, 如`DataManager.scan("game:<guild>:")`"""
+        result = cls.__backend.scan(prefix)
+        for changes in (cls.__flushing, cls.__pending):
+            for key, value in changes.items():
+                if key.startswith(prefix):
+                    if value is REMOVED:
+                        result.pop(key, None)
+                    else:
+                        result[key] = value
+        for key in [
+            k for k in result if k.startswith(EXPIRES_PREFIX) or cls.__is_expired(k)
+        ]:
+            del result[key]
+        return result
+
+    @classmethod
+    def purge_expired(cls):
+        """移除所有已过期的数据"""
+        now = time.time()
+        expired = [k for k, t in cls.__expires.items() if t <= now]
+        if expired:
+            cls.remove_many(expired)
+
+    @classmethod
+    def __lookup(cls, key: str) -> Any:
+        """依次从 写回缓冲 -> 写回中的修改 -> 存储引擎 中读取, 刚写入的键不会访问磁盘"""
+        value = cls.__lookup_local(key)
+        return cls.__backend.get(key) if value is _NOT_LOCAL else value
+
+    @classmethod
+    def __lookup_local(cls, key: str) -> Any:
+        """只从尚未写入存储引擎的修改中读取, 不在其中时返回`_NOT_LOCAL`"""
+        for changes in (cls.__pending, cls.__flushing):
+            if key in changes:
+                value = changes[key]
+                return MISSING if value is REMOVED else value
+        return _NOT_LOCAL
+
+    @staticmethod
+    def __resolve(key: str, value: Any, default: Any | None):
+        if value is MISSING:
+            if default is None:
+                raise KeyError(f"Key {key} not found in database.")
+            return default
+        return value
+
+    @classmethod
+    async def __run(cls, func: Callable[..., Any], *args: Any) -> Any:
+        """在存储线程中执行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls.__executor, func, *args)
+
+    @classmethod
+    async def __wait_threshold(cls):
+        if len(cls.__pending) >= cls.FLUSH_THRESHOLD:
+            await cls.aflush()
+        elif cls.__flush_task and not cls.__flush_task.done():
+            await asyncio.shield(cls.__flush_task)
+
+    @classmethod
+    def __is_expired(cls, key: str) -> bool:
+        expire_at = cls.__expires.get(key)
+        return expire_at is not None and expire_at <= time.time()
+
+    @classmethod
+    def __write(
+        cls, changes: list[tuple[str, Any, float | None]], schedule: bool = True
+    ):
+        """
+        将修改写入缓存与写回缓冲
+        - changes: (键, 新值或`REMOVED`, 有效期) 的列表
+        - schedule: 是否在达到阈值时安排写回
+        """
+        now = time.time()
+        for key, value, ttl in changes:
+            expire_at = now + ttl if ttl is not None else None
+            if value is REMOVED:
+                cls.__cache.pop(key)
+            else:
+                cls.__cache.set(key, value, expire_at)
+            cls.__pending[key] = value
+            # 过期时间按键单独保存, 写回量只与修改的键有关
+            if expire_at is not None:
+                cls.__expires[key] = expire_at
+                cls.__pending[EXPIRES_PREFIX + key] = expire_at
+            elif cls.__expires.pop(key, None) is not None:
+                cls.__pending[EXPIRES_PREFIX + key] = REMOVED
+        cls.__generation += 1
+        if schedule and len(cls.__pending) >= cls.FLUSH_THRESHOLD:
+            cls.__schedule_flush()
+
+    @classmethod
+    def __schedule_flush(cls):
+        """在事件循环中安排一次后台写回, 已有写回任务时不重复创建"""
+        if cls.__flush_task and not cls.__flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中(如脚本调用), 直接同步写回
+            cls.flush()
+            return
+        cls.__flush_task = loop.create_task(cls.aflush())
+
+    @classmethod
+    def __take_changes(cls) -> dict[str, Any] | None:
+        """取出写回缓冲中的全部修改, 没有修改时返回`None`"""
+        if not cls.__pending:
+            return None
+        changes = cls.__pending
+        cls.__pending = {}
+        cls.__flushing = changes
+        return changes
+
+    @classmethod
+    def __restore_changes(cls, changes: dict[str, Any]):
+        """写回失败时将修改放回缓冲, 不覆盖期间的新修改"""
+        for key, value in changes.items():
+            cls.__pending.setdefault(key, value)
+
+    @classmethod
+    def flush(cls):
+        """同步写回所有修改"""
+        changes = cls.__take_changes()
+        if changes is None:
+            return
+        try:
+            # 同样提交到存储线程, 保证与已排队的写回保持先后顺序
+            cls.__executor.submit(cls.__backend.write_batch, changes).result()
+        except Exception:
+            cls.__restore_changes(changes)
+            raise
+        finally:
+            cls.__flushing = {}
+
+    @classmethod
+    async def aflush(cls):
+        """在存储线程中写回所有修改, 序列化与磁盘写入不阻塞事件循环"""
+        # 写回在独立的任务中进行, 调用方被取消时已取出的修改仍会写完, 不会丢失
+        task = asyncio.ensure_future(cls.__write_pending())
+        cls.__write_task = task
+        await asyncio.shield(task)
+
+    @classmethod
+    async def __write_pending(cls):
+        async with cls.__flush_lock:
+            changes = cls.__take_changes()
+            if changes is None:
+                return
+            try:
+                await cls.__run(cls.__backend.write_batch, changes)
+            except Exception as e:
+                logger.error(f"数据写回失败: {e}")
+                cls.__restore_changes(changes)
+            except BaseException:
+                cls.__restore_changes(changes)
+                raise
+            finally:
+                cls.__flushing = {}
+
+    @classmethod
+    async def _flush_loop(cls):
+        while True:
+            await asyncio.sleep(cls.FLUSH_INTERVAL)
+            cls.purge_expired()
+            if cls.__pending:
+                await cls.aflush()
+
+    @classmethod
+    async def start(cls):
+        """启动定时写回任务"""
+        if cls.__flush_loop_task is None or cls.__flush_loop_task.done():
+            cls.__flush_loop_task = asyncio.create_task(cls._flush_loop())
+
+    @classmethod
+    async def close(cls):
+        """停止定时写回并强制写回所有修改"""
+        if cls.__flush_loop_task:
+            cls.__flush_loop_task.cancel()
+            cls.__flush_loop_task = None
+        # 不取消进行中的写回, 等待它完成
+        for task in (cls.__flush_task, cls.__write_task):
+            if task and not task.done():
+                await asyncio.shield(task)
+        cls.flush()
+        cls.__executor.submit(cls.__backend.close).result()
+        logger.info("数据已写回磁盘")
+
+
+class DataBatch:
+    """`DataManager.batch()`返回的批量修改"""
+
+    def __init__(self) -> None:
+        self._changes: dict[str, tuple[Any, float | None]] = {}
+
+    def get(self, key: str, default: Any | None = None):
+        """读取数据, 优先返回批次中尚未提交的修改"""
+        if key in self._changes:
+            value = self._changes[key][0]
+            if value is not REMOVED:
+                return value
+            if default is None:
+                raise KeyError(f"Key {key} not found in database.")
+            return default
+        return DataManager.get(key, default)
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        self._changes[key] = (value, ttl)
+
+    def set_many(self, items: dict[str, Any], ttl: float | None = None):
+        for key, value in items.items():
+            self._changes[key] = (value, ttl)
+
+    def remove(self, key: str):
+        self._changes[key] = (REMOVED, None)
+
+    def remove_many(self, keys: Iterable[str]):
+        for key in keys:
+            self._changes[key] = (REMOVED, None)
+
+    def _commit(self) -> bool:
+        if not self._changes:
+            return False
+        DataManager._commit_batch(
+            [(key, value, ttl) for key, (value, ttl) in self._changes.items()]
+        )
+        self._changes = {}
+        return True
+
+    def __enter__(self) -> "DataBatch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._changes = {}
+        elif self._commit():
+            DataManager.flush()
+
+    async def __aenter__(self) -> "DataBatch":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._changes = {}
+        elif self._commit():
+            await DataManager.aflush()
+
+
+async def _startup():
+    await DataManager.start()
+    # 启动时才注册关闭回调, 使其在所有插件的关闭回调之后执行, 插件关闭时写入的数据也能写回
+    if _driver:
+        _driver.on_shutdown(DataManager.close)
+
+
+if _driver:
+    _driver.on_startup(_startup)
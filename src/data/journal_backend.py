@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+from typing import Any
+
+from nonebot.log import logger
+
+from src.data.backend import StorageBackend, REMOVED, atomic_write
+from src.data.cache import MISSING
+
+
+class JournalBackend(StorageBackend):
+    """
+    ### 快照 + 追加日志 的存储引擎
+    - 快照与 pickledb 的数据文件格式相同(单个JSON对象), 可以直接沿用`erin/data/data.db`
+    - 每批修改只向日志追加一行记录, 写入成本与修改量成正比
+    - 启动时载入快照后按顺序重放日志
+    - 日志大小超过快照的`compact_ratio`倍时, 在后台线程中重写快照并清空日志
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compact_ratio: float = 2.0,
+        min_compact_bytes: int = 64 * 1024,
+    ) -> None:
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.rotated_path = f"{path}.journal.old"
+        """压缩期间被轮换下来的旧日志"""
+        self.compact_ratio = compact_ratio
+        self.min_compact_bytes = min_compact_bytes
+        self._lock = threading.Lock()
+        self._data: dict[str, Any] = {}
+        self._snapshot_size = 0
+        self._compaction: threading.Thread | None = None
+        self._load()
+        if os.path.exists(self.rotated_path):
+            self._recover()
+        self._journal = open(self.journal_path, "ab")
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                content = f.read().strip()
+            self._data = json.loads(content) if content else {}
+            self._snapshot_size = os.path.getsize(self.path)
+        # 旧日志存在说明上次压缩未完成, 其中的记录可能已写入快照, 重放是幂等的
+        for journal in (self.rotated_path, self.journal_path):
+            if os.path.exists(journal):
+                self._replay(journal)
+
+    def _recover(self):
+        """上次压缩未完成时, 将已重放的全部数据写成新快照并清空日志"""
+        data = json.dumps(self._data, ensure_ascii=False)
+        atomic_write(self.path, data)
+        self._snapshot_size = len(data.encode("utf-8"))
+        os.remove(self.rotated_path)
+        open(self.journal_path, "wb").close()
+
+    def _replay(self, journal: str):
+        valid_size = 0
+        with open(journal, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError
+                    record = json.loads(line)
+                except ValueError:
+                    # 最后一行可能因崩溃只写入了一半, 该批次视为未提交
+                    break
+                self._apply(record.get("s", {}), record.get("r", []))
+                valid_size += len(line)
+        if valid_size < os.path.getsize(journal):
+            # 截掉不完整的记录, 避免之后追加的记录与其拼接在同一行
+            with open(journal, "r+b") as f:
+                f.truncate(valid_size)
+
+    def _apply(self, sets: dict[str, Any], removes: list[str]):
+        for key in removes:
+            self._data.pop(key, None)
+        self._data.update(sets)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            return self._data.get(key, MISSING)
+
+    def scan(self, prefix: str) -> dict[str, Any]:
+        with self._lock:
+            return {k: v for k, v in self._data.items() if k.startswith(prefix)}
+
+    def write_batch(self, changes: dict[str, Any]) -> None:
+        sets = {k: v for k, v in changes.items() if v is not REMOVED}
+        removes = [k for k, v in changes.items() if v is REMOVED]
+        # 一批修改为一行记录, 保证批次的原子性
+        line = json.dumps({"s": sets, "r": removes}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._journal.write(line.encode("utf-8"))
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._apply(sets, removes)
+            if self._should_compact():
+                self._start_compaction()
+
+    def _should_compact(self) -> bool:
+        if self._compaction and self._compaction.is_alive():
+            return False
+        journal_size = self._journal.tell()
+        return journal_size >= self.min_compact_bytes and journal_size >= (
+            self._snapshot_size * self.compact_ratio
+        )
+
+    def _start_compaction(self):
+        """轮换日志并在后台线程中写入新快照, 需要在持有锁时调用"""
+        self._journal.close()
+        if os.path.exists(self.rotated_path):
+            # 上次压缩失败, 旧日志中的记录还没有写入快照, 不能覆盖
+            with open(self.journal_path, "rb") as src, open(self.rotated_path, "ab") as dst:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.rotated_path)
+        self._journal = open(self.journal_path, "ab")
+        # 在锁内序列化, 值可能在之后被修改
+        data = json.dumps(self._data, ensure_ascii=False)
+        self._compaction = threading.Thread(
+            target=self._compact, args=(data,), name="erin-data-compact"
+        )
+        self._compaction.start()
+
+    def _compact(self, data: str):
+        try:
+            atomic_write(self.path, data)
+            os.remove(self.rotated_path)
+        except Exception as e:
+            # 旧日志保留在磁盘上, 下次压缩或启动时重新处理
+            logger.error(f"数据日志压缩失败: {e}")
+            return
+        self._snapshot_size = len(data.encode("utf-8"))
+
+    def compact(self):
+        """立即压缩日志并等待完成"""
+        with self._lock:
+            if not (self._compaction and self._compaction.is_alive()):
+                self._start_compaction()
+            compaction = self._compaction
+        if compaction:
+            compaction.join()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._data
+
+    def close(self) -> None:
+        if self._compaction:
+            self._compaction.join()
+        with self._lock:
+            self._journal.close()
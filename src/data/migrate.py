@@ -0,0 +1,40 @@
+"""
+将旧的 pickledb 数据文件(`erin/data/data.db`)导入到其他存储引擎
+
+用法: `python -m src.data.migrate [源文件] [SQLite 数据库]`
+"""
+
+import json
+import os
+import sys
+
+from src.data.backend import StorageBackend
+
+
+def migrate_json_file(path: str, backend: StorageBackend) -> int:
+    """
+    将 pickledb 的JSON数据文件中的所有键写入`backend`, 在一个批次中提交
+    #### :return: 导入的键数量
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    data = json.loads(content) if content else {}
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} 不是有效的 pickledb 数据文件")
+    backend.write_batch(data)
+    return len(data)
+
+
+if __name__ == "__main__":
+    from src.data.sqlite_backend import SQLiteBackend
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "erin/data/data.db"
+    target = sys.argv[2] if len(sys.argv) > 2 else "erin/data/data.sqlite3"
+    sqlite_backend = SQLiteBackend(target)
+    try:
+        count = migrate_json_file(source, sqlite_backend)
+    finally:
+        sqlite_backend.close()
+    print(f"已从 {source} 导入 {count} 个键到 {target}")
@@ -0,0 +1,125 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
+
+from src.data.backend import StorageBackend, REMOVED
+from src.data.cache import MISSING
+
+
+_PREFIX_END = chr(0x10FFFF)
+"""前缀范围查询的上界后缀"""
+
+
+def split_namespace(key: str) -> tuple[str, str]:
+    """
+    拆分命名空间, `game:<guild>:state` => (`game`, `<guild>:state`)
+    不含`:`的键属于空命名空间
+    """
+    namespace, sep, _ = key.partition(":")
+    return (namespace, key) if sep else ("", key)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    ### 基于 SQLite(WAL 模式) 的存储引擎
+    - 每个键单独一行, 写入成本只与修改的键有关
+    - 键按`:`划分命名空间, 支持按前缀范围扫描(如 `game:<guild>:`)
+    - 一批修改在同一个事务中提交
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                value TEXT NOT NULL
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_namespace ON kv(namespace)")
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """在一个写事务中执行, 退出时提交, 出现异常时回滚"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._conn.execute("COMMIT")
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else MISSING
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        keys = list(keys)
+        result = {}
+        with self._lock:
+            # 分批查询, 避免超出 SQLite 的参数数量限制
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM kv WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                result.update((key, json.loads(value)) for key, value in rows)
+        return result
+
+    def scan(self, prefix: str) -> dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM kv WHERE key >= ? AND key < ?",
+                (prefix, prefix + _PREFIX_END),
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def keys(self, namespace: str) -> list[str]:
+        """获取命名空间下的所有键"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM kv WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def write_batch(self, changes: dict[str, Any]) -> None:
+        upserts = []
+        deletes = []
+        for key, value in changes.items():
+            if value is REMOVED:
+                deletes.append((key,))
+            else:
+                upserts.append(
+                    (key, split_namespace(key)[0], json.dumps(value, ensure_ascii=False))
+                )
+        with self.transaction() as conn:
+            if deletes:
+                conn.executemany("DELETE FROM kv WHERE key = ?", deletes)
+            if upserts:
+                conn.executemany(
+                    "INSERT INTO kv (key, namespace, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    upserts,
+                )
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM kv LIMIT 1").fetchone() is None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
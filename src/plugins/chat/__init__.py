@@ -1,13 +1,21 @@
+import time
+
 from nonebot.plugin import PluginMetadata
 from nonebot.rule import Rule
 from nonebot.log import logger
-from nonebot.adapters.onebot.v11 import MessageEvent, Message
+from nonebot.adapters.onebot.v11 import Bot, MessageEvent, Message
 from nonebot import get_plugin_config, on_command, on_message, get_driver
 from nonebot.params import CommandArg
 from typing import Dict, Any
 
 from src.plugins.chat.chat import Chat
+from src.plugins.chat.client import ClientPool
+from src.plugins.chat.stream import RateLimiter, StreamReply, StreamBuilder
 from src.plugins.chat.config import Config
+from src.plugins.chat.debounce import Debouncer
+from src.plugins.chat.intent import IntentRouter
+from src.plugins.chat.telemetry import Telemetry
+from src.plugins.chat.usage import UsageTracker
 from src.utilities.MessageUtilities import is_group_message, is_private_message
 
 
@@ -29,9 +37,29 @@ async def is_tome(event: MessageEvent) -> bool:
 command_matcher = on_command("ai", priority=config.command_priority, block=True)
 message_matcher = on_message(priority=config.priority, block=False, rule=is_tome)
 
+
+async def is_group_context(event: MessageEvent) -> bool:
+    return (
+        config.chat_group_context_enabled
+        and is_group_message(event)
+        and not event.is_tome()
+    )
+
+
+# 优先级最低, 只记录其他插件都没有处理的普通消息
+context_matcher = on_message(
+    priority=config.context_priority, block=False, rule=is_group_context
+)
+
 # 保存正在处理的会话状态
 active_sessions: Dict[str, Dict[str, Any]] = {}
 
+# 流式回复的发送限流, 按群(私聊为QQ号)计算
+stream_limiter = RateLimiter(config.chat_stream_interval)
+debouncer = Debouncer(config.chat_debounce_window, config.chat_debounce_max_wait)
+"""群聊中同一个人连续发送的消息合并为一条"""
+intent_router = IntentRouter()
+
 
 # 注册聊天事件处理器
 @Chat.on_message_received.add_handler
@@ -41,10 +69,16 @@ async def on_message_received(session_id: str, message: str):
 
 
 @Chat.on_response_chunk.add_handler
-async def on_response_chunk(session_id: str, chunk: str, current_result: str):
+async def on_response_chunk(
+    session_id: str, chunk: str, current_result: StreamBuilder
+):
     # 可以在这里实现实时输出，或保存中间状态
+    # current_result 在读取 text 时才拼接完整文本
     if session_id in active_sessions:
         active_sessions[session_id]["current_result"] = current_result
+    chat = Chat.find_session(session_id)
+    if chat and chat.stream:
+        chat.stream.feed(chunk)
 
 
 @Chat.on_response_received.add_handler
@@ -62,8 +96,17 @@ async def on_task_error(session_id: str, task_id: str, error: str):
         active_sessions[session_id]["error"] = error
 
 
+@context_matcher.handle()
+async def handle_group_context(event: MessageEvent):
+    text = event.get_plaintext()
+    if text and is_group_message(event):
+        nickname = event.sender.nickname or event.get_user_id()
+        Chat.group_context.add(str(event.group_id), nickname, text)
+
+
 @message_matcher.handle()
-async def handle_receive(event: MessageEvent):
+async def handle_receive(bot: Bot, event: MessageEvent):
+    received_at = time.monotonic()
     text = event.get_plaintext()
     nike_name = event.sender.nickname if event.sender.nickname else event.get_user_id()
     if is_group_message(event):
@@ -80,6 +123,27 @@ async def handle_receive(event: MessageEvent):
         nike_name = None
         session_id = event.get_user_id()
 
+    if is_group_message(event) and not text.startswith(("system:", "system：")):
+        merged = await debouncer.submit(
+            (event.group_id, event.get_user_id(), chat_type), text
+        )
+        if merged is None:
+            # 消息已合并到同一个人随后发送的消息中
+            await message_matcher.finish()
+        text = merged
+
+    if config.chat_intent_router and not text.startswith(("system:", "system：")):
+        local = await intent_router.route(text)
+        if local is not None:
+            intent, answer = local
+            logger.info(f"本地回答 [session:{session_id}, intent:{intent}]: {answer}")
+            if config.chat_intent_rewrite:
+                answer = await Chat.rewrite(
+                    answer, session_id, chat_type, event.get_user_id()
+                )
+            Telemetry.record("reply", "local", chat_type, time.monotonic() - received_at)
+            await message_matcher.finish(answer)
+
     # 记录会话开始
     if session_id not in active_sessions:
         active_sessions[session_id] = {"status": "new"}
@@ -87,22 +151,49 @@ async def handle_receive(event: MessageEvent):
     chat = Chat.get_session(session_id, chat_type)["chat"]
     return_text = None
 
+    stream = None
+    if config.chat_stream_reply:
+        stream = StreamReply(
+            lambda text: bot.send(event, text),
+            str(event.group_id) if is_group_message(event) else event.get_user_id(),
+            stream_limiter,
+            config.chat_stream_min_chars,
+            config.chat_stream_max_chars,
+        )
+
     try:
         if text.startswith("system:") or text.startswith("system："):
             chat.send_system(text[7:])
             if text.endswith("$"):
                 # 创建系统消息后立即发送请求
-                return_text = await chat.chat("")  # 发送空消息触发响应
+                return_text = await chat.chat(
+                    "", stream=stream, user_id=event.get_user_id()
+                )  # 发送空消息触发响应
         else:
             # 启动异步聊天请求
-            return_text = await chat.chat(text, nike_name)
+            return_text = await chat.chat(
+                text, nike_name, stream, user_id=event.get_user_id()
+            )
     except Exception as e:
         logger.error(f"处理消息异常: {e}")
         return_text = f"处理消息出错: {str(e)}"
+    finally:
+        if stream:
+            await stream.close()
+
+    if stream and stream.sent_count:
+        # 回复已经分段发送
+        return_text = None
+    # 回复可能来自任意后端, 模型记为`*`
+    Telemetry.record("reply", "*", chat_type, time.monotonic() - received_at)
 
     # 清理会话状态
     if session_id in active_sessions:
         del active_sessions[session_id]
+    if return_text is None:
+        # 回复已分段发送, 或消息已合并到同一会话的补充请求中
+        logger.info(f"没有需要单独返回的消息 [session:{session_id}]")
+        await message_matcher.finish()
     logger.info(f"返回消息: {return_text}")
     await message_matcher.finish(return_text)
 
@@ -135,6 +226,10 @@ async def handle_message(event: MessageEvent, args: Message = CommandArg()):
             chat = Chat.get_session(session_id, chat_type)["chat"]
             chat.clear_history()
             return_text = "历史记录已清空"
+        elif arg == "forget":
+            chat = Chat.get_session(session_id, chat_type)["chat"]
+            chat.forget()
+            return_text = "历史记录与长期记忆已清空"
         elif arg == "status":
             # 查看当前会话状态
             if session_id in active_sessions:
@@ -142,12 +237,28 @@ async def handle_message(event: MessageEvent, args: Message = CommandArg()):
                 return_text = f"当前会话状态: {status}"
             else:
                 return_text = "当前没有活动会话"
+            position = Chat.scheduler.position(session_id)
+            if position is not None:
+                return_text += f"\n排队位置: 第{position}位"
+            return_text += f"\n进行中的请求: {Chat.scheduler.running}/{Chat.scheduler.max_concurrency}, 排队: {Chat.scheduler.waiting}"
+            if Chat.response_cache is not None:
+                return_text += f"\n{Chat.response_cache.summary()}"
+        elif arg == "usage":
+            if event.get_user_id() == "1179629081":
+                return_text = usage_report()
+            else:
+                return_text = "权限不足"
+        elif arg == "stats":
+            if event.get_user_id() == "1179629081":
+                return_text = Telemetry.report()
+            else:
+                return_text = "权限不足"
         elif arg == "cancel":
-            # 取消当前任务
-            await Chat.cancel_all_tasks()
+            # 取消当前会话的任务
+            count = await Chat.cancel_session_tasks(session_id)
             if session_id in active_sessions:
                 del active_sessions[session_id]
-            return_text = "已取消所有正在进行的聊天任务"
+            return_text = f"已取消当前会话中{count}个正在进行的聊天任务"
         elif arg == "show":
             chat = Chat.get_session(session_id, chat_type)["chat"]
             history = [
@@ -158,11 +269,24 @@ async def handle_message(event: MessageEvent, args: Message = CommandArg()):
                 return_text = "\n".join(history)
             else:
                 return_text = "历史记录为空"
+            return_text += f"\n历史token估算: {chat.history.prompt_tokens}/{chat.history.budget}"
             return_text += f"\n当前模型: {Chat.get_model()}"
     elif len(_args) == 2:
-        if _args[0] == "setModel":
+        if _args[0] == "cancel" and _args[1] == "all":
             if event.get_user_id() == "1179629081":
-                Chat.set_model(_args[1])
+                count = await Chat.cancel_all_tasks()
+                active_sessions.clear()
+                return_text = f"已取消所有会话中{count}个正在进行的聊天任务"
+            else:
+                return_text = "权限不足"
+        elif _args[0] == "cache" and _args[1] in ("on", "off"):
+            chat = Chat.get_session(session_id, chat_type)["chat"]
+            chat.cache_enabled = _args[1] == "on"
+            return_text = f"已{'开启' if chat.cache_enabled else '关闭'}当前会话的回复缓存"
+        elif _args[0] == "setModel":
+            if event.get_user_id() == "1179629081":
+                model = None if _args[1] == "auto" else _args[1]
+                Chat.set_model(model)
                 return_text = f"已设置模型为{_args[1]}"
             else:
                 return_text = "权限不足"
@@ -170,11 +294,41 @@ async def handle_message(event: MessageEvent, args: Message = CommandArg()):
     await command_matcher.finish(return_text)
 
 
+def usage_report(n: int = 10) -> str:
+    """当天用量最多的群与用户"""
+    lines = [f"{UsageTracker.today()} 的用量 (输入/输出 token, 请求数):"]
+    for scope, title in (("group", "群"), ("user", "用户")):
+        top = UsageTracker.top(scope, n)
+        lines.append(f"[{title}]" + ("" if top else " 暂无"))
+        lines.extend(
+            f"{i + 1}. {id}: {prompt}/{completion}, {requests}次"
+            for i, (id, (prompt, completion, requests)) in enumerate(top)
+        )
+    return "\n".join(lines)
+
+
+# 启动时创建共享的客户端
+async def _startup():
+    ClientPool.configure(
+        max_connections=config.chat_max_connections,
+        max_keepalive_connections=config.chat_max_keepalive_connections,
+        keepalive_expiry=config.chat_keepalive_expiry,
+        timeout=config.chat_timeout,
+    )
+    for backend in Chat.router.all_backends():
+        ClientPool.get_client(backend.base_url, backend.api_key)
+
+
 # 在插件卸载时清理任务
 async def _unload():
     logger.info("正在清理聊天任务...")
     await Chat.cancel_all_tasks()
+    # 换出所有会话, 重启后可以继续之前的对话
+    Chat.spill_all_sessions()
+    UsageTracker.flush()
+    await ClientPool.close_all()
 
 
 driver = get_driver()
+driver.on_startup(_startup)
 driver.on_shutdown(_unload)
@@ -0,0 +1,287 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Sequence
+
+from openai import AsyncOpenAI
+from nonebot.log import logger
+
+from src.plugins.chat.client import ClientPool
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """样本的分位数(最近秩法), `q`取值为 0 ~ 1"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class BackendStats:
+    """后端最近的首字延迟与错误率, 只保留固定数量的样本"""
+
+    MIN_SAMPLES = 5
+    """计算分位数所需的最少样本数"""
+
+    def __init__(self, window: int = 50) -> None:
+        self.ttft: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        """最近请求是否出错"""
+        self.consecutive_errors = 0
+        self.last_error_time = 0.0
+
+    def record_success(self, ttft: float | None = None):
+        """记录一次成功的请求, 非流式请求没有首字延迟"""
+        if ttft is not None:
+            self.ttft.append(ttft)
+        self.outcomes.append(False)
+        self.consecutive_errors = 0
+
+    def record_error(self):
+        self.outcomes.append(True)
+        self.consecutive_errors += 1
+        self.last_error_time = time.monotonic()
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def ttft_percentile(self, q: float) -> float | None:
+        if len(self.ttft) < self.MIN_SAMPLES:
+            return None
+        return percentile(self.ttft, q)
+
+
+class Backend:
+    """一个 OpenAI 兼容接口地址与模型的组合"""
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: str) -> None:
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.stats = BackendStats()
+
+    def __repr__(self) -> str:
+        return f"Backend({self.name}, {self.model})"
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        return ClientPool.get_client(self.base_url, self.api_key)
+
+
+class BackendStream:
+    """
+    选中后端的流式响应
+    先产出建立连接时已读取的片段, 再继续读取剩余的片段
+    """
+
+    def __init__(self, backend: Backend, response: Any, iterator: Any, buffered: List[Any]):
+        self.backend = backend
+        self._response = response
+        self._iterator = iterator
+        self._buffered = buffered
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        for chunk in self._buffered:
+            yield chunk
+        self._buffered = []
+        try:
+            async for chunk in self._iterator:
+                yield chunk
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.backend.stats.record_error()
+            raise
+        finally:
+            await _close_response(self._response)
+
+    async def close(self):
+        """不读取剩余片段, 直接关闭响应与连接"""
+        await _close_response(self._response)
+
+
+async def _close_response(response: Any):
+    try:
+        await response.close()
+    except Exception:
+        pass
+
+
+def _has_content(chunk: Any) -> bool:
+    return bool(chunk.choices and chunk.choices[0].delta.content)
+
+
+class BackendRouter:
+    """
+    ### 多后端故障转移与对冲请求
+    - 按最近的首字延迟与错误率选择最健康的后端, 连续出错的后端冷却一段时间
+    - 首个后端在 p95 首字延迟内没有返回内容时, 向下一个后端发出对冲请求, 先返回内容的一方胜出, 另一方被取消
+    - 后端在返回内容前出错时立即转移到下一个后端
+    """
+
+    ERROR_COOLDOWN = 30.0
+    """连续出错的后端被降级的时长(秒)"""
+    COOLDOWN_ERRORS = 3
+    """触发降级的连续错误次数"""
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        hedge: bool = True,
+        hedge_min_delay: float = 1.0,
+        hedge_max_delay: float = 8.0,
+    ) -> None:
+        if not backends:
+            raise ValueError("至少需要一个后端")
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self._pinned: Dict[str, Backend] = {}
+        """指定模型时在主后端上创建的临时后端"""
+
+    @property
+    def primary(self) -> Backend:
+        return self.backends[0]
+
+    def all_backends(self) -> List[Backend]:
+        return self.backends + list(self._pinned.values())
+
+    def ranked(self, model: str | None = None) -> List[Backend]:
+        """按健康程度排序的候选后端, 指定模型时只包含提供该模型的后端"""
+        candidates = self.backends
+        if model is not None:
+            candidates = [b for b in self.backends if b.model == model]
+            if not candidates:
+                pinned = self._pinned.get(model)
+                if pinned is None:
+                    pinned = Backend(
+                        f"{self.primary.name}:{model}",
+                        self.primary.base_url,
+                        model,
+                        self.primary.api_key,
+                    )
+                    self._pinned[model] = pinned
+                candidates = [pinned]
+        now = time.monotonic()
+
+        def score(item: tuple[int, Backend]) -> tuple[bool, float, int]:
+            index, backend = item
+            stats = backend.stats
+            cooling = (
+                stats.consecutive_errors >= self.COOLDOWN_ERRORS
+                and now - stats.last_error_time < self.ERROR_COOLDOWN
+            )
+            latency = stats.ttft_percentile(0.5) or 1.0
+            return cooling, latency * (1 + 4 * stats.error_rate), index
+
+        return [b for _, b in sorted(enumerate(candidates), key=score)]
+
+    def hedge_delay(self, backend: Backend) -> float:
+        """对冲延迟: 后端的 p95 首字延迟, 限制在配置的范围内"""
+        p95 = backend.stats.ttft_percentile(0.95)
+        if p95 is None:
+            return self.hedge_max_delay
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, p95))
+
+    async def open_stream(
+        self, messages: List[Any], model: str | None = None, **kwargs: Any
+    ) -> BackendStream:
+        """在最健康的后端上发起流式请求, 返回第一个产出内容的后端的响应"""
+        candidates = self.ranked(model)
+        tasks: Dict[asyncio.Task, Backend] = {}
+        last_error: Exception | None = None
+
+        def launch():
+            backend = candidates.pop(0)
+            task = asyncio.create_task(self._open(backend, messages, kwargs))
+            tasks[task] = backend
+
+        launch()
+        try:
+            while tasks:
+                timeout = None
+                if self.hedge and candidates and len(tasks) == 1:
+                    timeout = self.hedge_delay(next(iter(tasks.values())))
+                done, _ = await asyncio.wait(
+                    tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.info(f"首字超时, 向 {candidates[0]} 发出对冲请求")
+                    launch()
+                    continue
+                winner: BackendStream | None = None
+                for task in done:
+                    backend = tasks.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if winner is None:
+                            winner = task.result()
+                        else:
+                            # 同一轮中同时建立成功的对冲请求, 关闭多余的连接
+                            await task.result().close()
+                        continue
+                    logger.warning(f"后端 {backend} 请求失败: {error}")
+                    last_error = error if isinstance(error, Exception) else last_error
+                if winner is not None:
+                    return winner
+                if not tasks and candidates:
+                    launch()
+        finally:
+            for task in tasks:
+                task.cancel()
+        raise last_error or RuntimeError("没有可用的后端")
+
+    async def complete(
+        self, messages: List[Any], model: str | None = None, **kwargs: Any
+    ) -> tuple[Backend, Any]:
+        """
+        非流式请求, 按健康程度依次尝试各后端, 不对冲
+        #### :return: (成功的后端, 响应)
+        """
+        last_error: Exception | None = None
+        for backend in self.ranked(model):
+            try:
+                response = await backend.client.chat.completions.create(
+                    model=backend.model, messages=messages, **kwargs
+                )
+            except Exception as e:
+                backend.stats.record_error()
+                logger.warning(f"后端 {backend} 请求失败: {e}")
+                last_error = e
+                continue
+            backend.stats.record_success()
+            return backend, response
+        raise last_error or RuntimeError("没有可用的后端")
+
+    async def _open(
+        self, backend: Backend, messages: List[Any], kwargs: Dict[str, Any]
+    ) -> BackendStream:
+        start = time.monotonic()
+        response = None
+        try:
+            response = await backend.client.chat.completions.create(
+                model=backend.model, messages=messages, stream=True, **kwargs
+            )
+            iterator = response.__aiter__()
+            buffered = []
+            # 读到第一个有内容的片段(或流结束)才算建立成功
+            async for chunk in iterator:
+                buffered.append(chunk)
+                if _has_content(chunk):
+                    break
+            backend.stats.record_success(time.monotonic() - start)
+            return BackendStream(backend, response, iterator, buffered)
+        except asyncio.CancelledError:
+            if response is not None:
+                await _close_response(response)
+            raise
+        except Exception:
+            backend.stats.record_error()
+            if response is not None:
+                await _close_response(response)
+            raise
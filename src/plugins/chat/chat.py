@@ -1,32 +1,92 @@
+import re
 import time
+import heapq
 import asyncio
 from typing import TypedDict, Dict, List, Callable, Awaitable, Literal, Any
 from openai import AsyncOpenAI
 import nonebot
 from nonebot.log import logger
 
-from nonebot import require
+from nonebot import require, get_plugin_config
 
 require("nonebot_plugin_apscheduler")
 
 from nonebot_plugin_apscheduler import scheduler
-from src.plugins.chat.constant import GROUP_SYSTEM_PROMPT, GROUP_SYSTEM_PROMPT_CUSTOMIZE
+from src.plugins.chat.constant import (
+    GROUP_SYSTEM_PROMPT,
+    GROUP_SYSTEM_PROMPT_CUSTOMIZE,
+    SUMMARY_PROMPT,
+    INTENT_REWRITE_PROMPT,
+)
+from src.plugins.chat.history import (
+    ChatHistory,
+    Message,
+    estimate_tokens,
+    message_tokens,
+)
+from src.plugins.chat.memory import MemoryIndex
+from src.plugins.chat.group_context import GroupContextBuffer
+from src.plugins.chat.routing import ComplexityRouter, Route
+from src.plugins.chat.stream import StreamReply, StreamBuilder
+from src.plugins.chat.scheduler import RequestScheduler, DeadlineExceeded
+from src.plugins.chat.tasks import TaskRegistry
+from src.plugins.chat.backends import Backend, BackendRouter
+from src.plugins.chat.completion_cache import CompletionCache, make_key
+from src.plugins.chat.session_store import SessionStore
+from src.plugins.chat.telemetry import Telemetry
+from src.plugins.chat.usage import UsageTracker
+from src.plugins.chat.config import Config
+
+config = get_plugin_config(Config)
 
 
 class ChatEvent:
-    def __init__(self, name: str):
+    """
+    ### 聊天事件
+    触发时所有处理器并发执行, 每个处理器有独立的超时, 处理器的异常与超时只记录日志, 不影响聊天流程
+    """
+
+    def __init__(self, name: str, timeout: float | None = 10.0):
         self.name = name
+        self.timeout = timeout
         self.handlers: List[Callable[..., Awaitable[Any]]] = []
 
     async def trigger(self, *args, **kwargs):
-        for handler in self.handlers:
-            await handler(*args, **kwargs)
+        if len(self.handlers) == 1:
+            await self._run(self.handlers[0], *args, **kwargs)
+        elif self.handlers:
+            await asyncio.gather(
+                *(self._run(handler, *args, **kwargs) for handler in self.handlers)
+            )
+
+    async def _run(self, handler: Callable[..., Awaitable[Any]], *args, **kwargs):
+        name = getattr(handler, "__name__", repr(handler))
+        try:
+            await asyncio.wait_for(handler(*args, **kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"事件 {self.name} 的处理器 {name} 超时")
+        except Exception as e:
+            logger.error(f"事件 {self.name} 的处理器 {name} 出错: {e}")
 
     def add_handler(self, handler: Callable[..., Awaitable[Any]]):
         self.handlers.append(handler)
         return handler
 
 
+_SPEAKER_PREFIX = re.compile(r"^<[^<>]*>: ", re.M)
+"""群聊消息(每行)前的发送者昵称`<昵称>: `"""
+
+
+def _usage_tokens(messages: List[Message], usage: Any, result: str) -> tuple[int, int]:
+    """
+    (提示 token 数, 回复 token 数)
+    - usage: 接口返回的实际用量, 没有返回时按文本估算
+    """
+    if usage is not None:
+        return usage.prompt_tokens, usage.completion_tokens
+    return sum(message_tokens(m) for m in messages), estimate_tokens(result)
+
+
 class SessionInfo(TypedDict):
     chat: "Chat"
     last_activity_time: float
@@ -34,13 +94,66 @@ class SessionInfo(TypedDict):
 
 SessionDict = dict[str, SessionInfo]
 
+DEFAULT_MODEL = "deepseek-ai/DeepSeek-V3"
+
+
+def _build_backends(api_key: str) -> List[Backend]:
+    """根据配置创建后端列表, 没有配置时使用`chat_base_url`上的默认模型"""
+    if not config.chat_backends:
+        return [Backend("default", config.chat_base_url, DEFAULT_MODEL, api_key)]
+    return [
+        Backend(
+            item.get("name", item["base_url"]),
+            item["base_url"],
+            item.get("model", DEFAULT_MODEL),
+            item.get("api_key", api_key),
+        )
+        for item in config.chat_backends
+    ]
+
 
 class Chat:
-    base_url = "https://api.siliconflow.cn/v1"
     api_key = nonebot.get_driver().config.siliconflow_api_key
     _session_dictionary: SessionDict = {}
-    _task_pool: Dict[str, asyncio.Task] = {}
-    _model: str = "deepseek-ai/DeepSeek-V3"
+    _activity_heap: List[tuple[float, str]] = []
+    """(最后活动时间, 会话ID) 的最小堆, 会话活动时压入新记录, 旧记录在弹出时跳过"""
+    _task_pool = TaskRegistry()
+    _model: str | None = None
+    """手动指定的模型, 为`None`时由路由器在所有后端中选择"""
+    router = BackendRouter(
+        _build_backends(api_key),
+        hedge=config.chat_hedge_enabled,
+        hedge_min_delay=config.chat_hedge_min_delay,
+        hedge_max_delay=config.chat_hedge_max_delay,
+    )
+    """所有会话共享的后端路由器"""
+    scheduler = RequestScheduler(
+        max_concurrency=config.chat_max_concurrency,
+        deadline=config.chat_queue_deadline,
+        private_weight=config.chat_private_weight,
+        group_weight=config.chat_group_weight,
+    )
+    """所有会话共享的上游请求调度器"""
+    response_cache = (
+        CompletionCache(
+            ttl=config.chat_cache_ttl,
+            max_items=config.chat_cache_max_items,
+            max_bytes=config.chat_cache_max_bytes,
+        )
+        if config.chat_cache_enabled
+        else None
+    )
+    """输入完全相同的请求的回复缓存, 未启用时为`None`"""
+    group_context = GroupContextBuffer(
+        max_lines=config.chat_group_context_max_lines,
+        max_chars=config.chat_group_context_max_chars,
+        max_bytes=config.chat_group_context_max_bytes,
+    )
+    """群里最近没有@机器人的消息"""
+    model_router = ComplexityRouter(
+        config.chat_fast_model, config.chat_fast_route_threshold
+    )
+    """按提问的复杂度在小模型与默认模型之间分流"""
 
     # 事件定义
     on_message_received = ChatEvent("message_received")
@@ -50,95 +163,360 @@ class Chat:
     on_task_error = ChatEvent("task_error")
 
     @classmethod
-    def set_model(cls, model: str):
+    def set_model(cls, model: str | None):
+        """指定模型, 只在提供该模型的后端之间故障转移; 为`None`时恢复自动选择"""
         cls._model = model
 
     @classmethod
     def get_model(cls) -> str:
-        return cls._model
+        return cls._model or cls.router.ranked()[0].model
+
+    @classmethod
+    async def rewrite(
+        cls,
+        text: str,
+        session_id: str,
+        type: Literal["group", "private"],
+        user_id: str | None = None,
+    ) -> str:
+        """用人设的语气改写本地引擎的回答, 失败时返回原文"""
+        messages: List[Message] = [
+            {"role": "system", "content": INTENT_REWRITE_PROMPT},
+            {"role": "user", "content": text},
+        ]
+        try:
+            async with cls.scheduler.slot(session_id, type):
+                _, response = await cls.router.complete(
+                    messages, model=cls._model, max_tokens=200
+                )
+        except Exception as e:
+            logger.error(f"改写本地回答失败: {e}")
+            return text
+        result = (response.choices[0].message.content or "").strip()
+        if type == "group":
+            usage_ids = (session_id, user_id)
+        else:
+            usage_ids = (None, user_id or session_id)
+        tokens = _usage_tokens(messages, getattr(response, "usage", None), result)
+        UsageTracker.record(*usage_ids, *tokens)
+        return result or text
 
     @classmethod
     def get_session(cls, session_id: str, type: Literal["group", "private"]):
+        """获取会话, 会话已被换出时从磁盘恢复, 不存在时创建"""
         if session_id not in cls._session_dictionary:
+            # 先腾出位置再加入新会话, 避免把刚创建的会话换出
+            if len(cls._session_dictionary) >= config.chat_max_sessions:
+                cls.spill_idle_sessions(limit=config.chat_max_sessions - 1)
+            state = SessionStore.load(session_id)
+            chat = cls(session_id, type)
+            if state is not None:
+                chat.load_state(state)
             cls._session_dictionary[session_id] = {
-                "chat": cls(session_id, type),
+                "chat": chat,
                 "last_activity_time": time.time(),
             }
+            cls._touch(session_id)
+        else:
+            cls._touch(session_id)
         return cls._session_dictionary[session_id]
 
     @classmethod
-    def clean_expired_session(cls):
-        be_cleaned = []
-        for session_id, session_info in cls._session_dictionary.items():
-            if time.time() - session_info["last_activity_time"] > 60 * 60 * 2:
-                be_cleaned.append(session_id)
-        for session_id in be_cleaned:
+    def find_session(cls, session_id: str) -> "Chat | None":
+        """获取已存在的会话, 不存在时返回`None`"""
+        session = cls._session_dictionary.get(session_id)
+        return session["chat"] if session else None
+
+    @classmethod
+    def _touch(cls, session_id: str):
+        """记录会话的活动时间"""
+        now = time.time()
+        cls._session_dictionary[session_id]["last_activity_time"] = now
+        heapq.heappush(cls._activity_heap, (now, session_id))
+        if len(cls._activity_heap) > 2 * len(cls._session_dictionary) + 64:
+            # 堆中积累了过多失效的记录时重建
+            cls._activity_heap = [
+                (info["last_activity_time"], sid)
+                for sid, info in cls._session_dictionary.items()
+            ]
+            heapq.heapify(cls._activity_heap)
+
+    @classmethod
+    def spill_idle_sessions(
+        cls, idle: float | None = None, limit: int | None = None
+    ) -> int:
+        """
+        把空闲的会话换出到磁盘, 从最久没有活动的会话开始, 不需要遍历所有会话
+        - idle: 空闲超过该时长(秒)的会话被换出, 默认使用配置
+        - limit: 换出直到内存中的会话数不超过该值, 不论是否空闲
+        #### :return: 换出的会话数
+        """
+        idle = config.chat_session_idle_minutes * 60 if idle is None else idle
+        deadline = time.time() - idle
+        heap = cls._activity_heap
+        busy: List[tuple[float, str]] = []
+        count = 0
+        while heap:
+            activity_time, session_id = heap[0]
+            over_limit = limit is not None and len(cls._session_dictionary) > limit
+            if activity_time > deadline and not over_limit:
+                break
+            heapq.heappop(heap)
+            info = cls._session_dictionary.get(session_id)
+            if info is None or info["last_activity_time"] != activity_time:
+                continue
+            chat = info["chat"]
+            if chat.busy:
+                busy.append((activity_time, session_id))
+                continue
+            SessionStore.save(
+                session_id, chat.dump_state(), ttl=config.chat_session_spill_ttl
+            )
             del cls._session_dictionary[session_id]
+            count += 1
+        for item in busy:
+            heapq.heappush(heap, item)
+        if count:
+            logger.info(f"已将{count}个空闲的聊天会话换出到磁盘")
+        return count
 
     @classmethod
-    async def cancel_all_tasks(cls):
-        """取消所有正在运行的任务"""
-        for task_id, task in cls._task_pool.items():
-            if not task.done():
-                task.cancel()
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    logger.info(f"Task {task_id} cancelled")
-                except Exception as e:
-                    logger.error(f"Error cancelling task {task_id}: {e}")
-        cls._task_pool.clear()
+    def spill_all_sessions(cls) -> int:
+        """换出所有没有进行中请求的会话, 用于关闭时保存对话"""
+        return cls.spill_idle_sessions(idle=float("-inf"))
+
+    @classmethod
+    async def cancel_all_tasks(cls) -> int:
+        """取消所有正在运行的任务, 返回取消的任务数"""
+        return await cls._task_pool.cancel_all()
+
+    @classmethod
+    async def cancel_session_tasks(cls, session_id: str) -> int:
+        """取消会话中正在运行的任务, 返回取消的任务数"""
+        return await cls._task_pool.cancel_session(session_id)
 
     def __init__(self, session_id: str, type: Literal["group", "private"]) -> None:
-        self.client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key)
-        self.history = []
+        self.history = ChatHistory(config.chat_history_token_budget)
+        self._evicted: List[Message] = []
+        """等待压缩为摘要的历史"""
+        self._summary_task: asyncio.Task | None = None
+        self._inflight: asyncio.Task | None = None
+        """当前进行中的请求"""
+        self._queued: List[Message] = []
+        """请求进行中时到达的消息"""
+        self._followup: asyncio.Future | None = None
+        """排队消息的补充请求结果"""
+        self._followup_owner: object | None = None
+        """最后一条排队消息的标识, 补充请求的回复交给它返回"""
+        self._followup_stream: StreamReply | None = None
+        self._followup_requester: str | None = None
+        """最后一条排队消息的发送者, 补充请求的用量记在其名下"""
+        self.stream: StreamReply | None = None
+        """当前请求的流式发送目标"""
+        self.cache_enabled = True
+        """是否对本会话使用回复缓存"""
+        self.memory = MemoryIndex(config.chat_memory_capacity)
+        """从历史中淘汰的旧对话, 按相关性检索后放入提示"""
         self.session_id = session_id
         self.task_id = 0
         self.type: Literal["group", "private"] = type
         self._non_system_message_count = 0
 
-    async def chat(self, message: str, character: str | None = None) -> str:
-        """创建聊天任务并添加到任务池"""
+    @property
+    def busy(self) -> bool:
+        """会话是否有进行中的请求、排队的消息或后台的摘要任务"""
+        return bool(
+            self._inflight
+            or self._queued
+            or self._followup
+            or self._evicted
+            or (self._summary_task and not self._summary_task.done())
+        )
+
+    def dump_state(self) -> Dict[str, Any]:
+        """可以JSON序列化的会话状态"""
+        return {
+            "type": self.type,
+            "history": self.history.to_dict(),
+            "task_id": self.task_id,
+            "non_system_message_count": self._non_system_message_count,
+            "cache_enabled": self.cache_enabled,
+            "memory": self.memory.to_dict(),
+        }
+
+    def load_state(self, state: Dict[str, Any]):
+        """恢复`dump_state`保存的状态"""
+        self.history = ChatHistory.from_dict(
+            config.chat_history_token_budget, state.get("history", {})
+        )
+        self.task_id = state.get("task_id", 0)
+        self._non_system_message_count = state.get("non_system_message_count", 0)
+        self.cache_enabled = state.get("cache_enabled", True)
+        self.memory = MemoryIndex.from_dict(
+            config.chat_memory_capacity, state.get("memory", {})
+        )
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """主后端的共享客户端"""
+        return Chat.router.primary.client
+
+    async def chat(
+        self,
+        message: str,
+        character: str | None = None,
+        stream: StreamReply | None = None,
+        user_id: str | None = None,
+    ) -> str | None:
+        """
+        创建聊天任务并添加到任务池
+        会话已有请求在进行时, 消息进入等待队列, 在进行中的请求结束后由一次补充请求统一回答
+        - stream: 流式发送目标, 生成过程中的输出会写入其中
+        - user_id: 发送者的QQ号, 用于统计用量与检查额度
+        #### :return: 回复内容, 被合并的消息中只有最后一条返回回复, 其余返回`None`
+        """
         if self._non_system_message_count == 0 and self.type == "group":
             if message.startswith("@"):
                 message = message[1:]
                 self.send_system(GROUP_SYSTEM_PROMPT_CUSTOMIZE.format(identity=message))
             else:
                 self.send_system(GROUP_SYSTEM_PROMPT)
-        if self.type == "group":
-            if message != "":
-                self.history.append(
-                    {"role": "user", "content": f"<{character}>: {message}"}
-                )
-                self._non_system_message_count += 1
-        else:
-            if message != "":
-                self.history.append({"role": "user", "content": message})
-                self._non_system_message_count += 1
+        user_message: Message | None = None
+        if message != "":
+            if self.type == "group":
+                user_message = {"role": "user", "content": f"<{character}>: {message}"}
+            else:
+                user_message = {"role": "user", "content": message}
+            self._non_system_message_count += 1
 
         # 触发消息接收事件
         await Chat.on_message_received.trigger(self.session_id, message)
 
+        if self._inflight and self.type == "private" and config.chat_preempt_private:
+            # 抢占: 取消正在生成、已经没人会看的旧回复, 新消息与排队的消息一起重新请求
+            if Chat._task_pool.cancel_session_nowait(self.session_id):
+                logger.info(f"会话 {self.session_id} 的旧回复被新消息抢占")
+        if self._inflight:
+            return await self._join_followup(user_message, stream, user_id)
+
+        if user_message:
+            self.history.append(user_message)
+        return await self._dispatch(stream, user_id)
+
+    async def _join_followup(
+        self,
+        user_message: Message | None,
+        stream: StreamReply | None,
+        user_id: str | None = None,
+    ) -> str | None:
+        """加入等待队列, 等待补充请求的结果"""
+        if user_message:
+            self._queued.append(user_message)
+        if self._followup is None:
+            self._followup = asyncio.get_running_loop().create_future()
+        followup = self._followup
+        token = object()
+        self._followup_owner = token
+        self._followup_stream = stream
+        self._followup_requester = user_id
+        owner, result = await asyncio.shield(followup)
+        return result if owner is token else None
+
+    async def _dispatch(
+        self, stream: StreamReply | None = None, user_id: str | None = None
+    ) -> str | None:
+        """
+        以当前历史发起一次请求, 结束后处理期间排队的消息
+        - user_id: 本轮的发送者, 在发起请求时确定, 不受之后到达的消息影响
+        """
+        self.stream = stream
         # 创建任务ID
         self.task_id += 1
         task_id = f"{self.session_id}_{self.task_id}"
 
         # 创建并启动任务
-        task = asyncio.create_task(self._process_chat_task(task_id))
-        Chat._task_pool[task_id] = task
+        task = asyncio.create_task(self._process_chat_task(task_id, user_id))
+        Chat._task_pool.add(self.session_id, task_id, task)
+        self._inflight = task
 
         # 等待任务完成并返回结果
         try:
             return await task
+        except asyncio.CancelledError:
+            if not Chat._task_pool.cancel_requested(task_id):
+                # 等待任务的协程本身被取消
+                raise
+            # 只有聊天任务被取消(抢占或`/ai cancel`), 不返回回复
+            logger.info(f"Chat task {task_id} cancelled")
+            return None
         except Exception as e:
             logger.error(f"Chat task {task_id} failed: {e}")
             await Chat.on_task_error.trigger(self.session_id, task_id, str(e))
             return f"聊天请求处理失败: {str(e)}"
-
-    async def _process_chat_task(self, task_id: str) -> str:
+        finally:
+            Chat._task_pool.clear_cancel_request(task_id)
+            self._inflight = None
+            self.stream = None
+            if self._followup is not None:
+                self._start_followup()
+
+    def _start_followup(self):
+        """把排队的消息一起写入历史, 用一次请求统一回答"""
+        followup, owner = self._followup, self._followup_owner
+        stream = self._followup_stream
+        requester = self._followup_requester
+        self._followup = None
+        self._followup_owner = None
+        self._followup_stream = None
+        self._followup_requester = None
+        for message in self._queued:
+            self.history.append(message)
+        self._queued = []
+
+        async def run():
+            try:
+                result = await self._dispatch(stream, requester)
+            except asyncio.CancelledError:
+                if followup and not followup.done():
+                    followup.cancel()
+                raise
+            if followup and not followup.done():
+                followup.set_result((owner, result))
+
+        # 占住会话, 避免补充请求开始前到达的消息另起请求
+        self._inflight = asyncio.create_task(run())
+
+    async def _process_chat_task(self, task_id: str, user_id: str | None = None) -> str:
         """处理聊天任务"""
         try:
-            result = await self._send_request()
+            Chat._touch(self.session_id)
+            # 超出 token 预算时淘汰最早的对话
+            self._compact_history()
+            question = self._current_question()
+            messages = self._prompt_messages(question)
+            route = self._route(question)
+            cache_key, messages = self._cache_request(messages, route)
+            cached = Chat.response_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                # 命中缓存时不占用上游的并发额度
+                builder = StreamBuilder()
+                builder.append(cached)
+                await Chat.on_response_chunk.trigger(self.session_id, cached, builder)
+                result = await self._finish_response(cached)
+            else:
+                route = self._apply_quota(route, user_id)
+                if route is None:
+                    return config.chat_quota_reply
+                try:
+                    queued_at = time.monotonic()
+                    async with Chat.scheduler.slot(self.session_id, self.type):
+                        queue_wait = time.monotonic() - queued_at
+                        result = await self._send_request(
+                            messages, route, cache_key, queue_wait, user_id
+                        )
+                except DeadlineExceeded as e:
+                    logger.warning(f"Chat task {task_id} dropped: {e}")
+                    return config.chat_deadline_reply
             await Chat.on_task_complete.trigger(self.session_id, task_id, result)
             return result
         except Exception as e:
@@ -146,44 +524,249 @@ class Chat:
             await Chat.on_task_error.trigger(self.session_id, task_id, str(e))
             raise
 
-    async def _send_request(self) -> str:
+    def _current_question(self) -> str:
+        """本轮的提问: 历史末尾连续的用户消息(可能有多条被合并的消息)"""
+        query: List[str] = []
+        for message in reversed(self.history.messages):
+            if message["role"] != "user":
+                break
+            query.append(message["content"])
+        return "\n".join(reversed(query))
+
+    def _route(self, question: str) -> Route:
+        """选择本轮使用的模型, 手动指定的模型优先"""
+        if Chat._model:
+            return Route("pinned", Chat._model, 0.0)
+        # 昵称两侧的`<>`会被当作代码特征, 只按消息内容估计复杂度
+        route = Chat.model_router.route(
+            _SPEAKER_PREFIX.sub("", question), self.history.prompt_tokens
+        )
+        logger.debug(f"会话 {self.session_id} 的提问复杂度 {route.score:.2f}, 路线: {route.name}")
+        return route
+
+    def _prompt_messages(self, question: str) -> List[Message]:
+        """
+        本轮发送的消息: 历史、摘要, 以及
+        - 从长期记忆中检索到的与本轮提问相关的旧对话
+        - 群聊中最近没有@机器人的消息
+        """
+        context: List[str] = []
+        if config.chat_memory_enabled and self.memory:
+            snippets = self.memory.search(
+                question, config.chat_memory_top_k, config.chat_memory_min_score
+            )
+            if snippets:
+                context.append("## 可能相关的旧对话\n" + "\n---\n".join(snippets))
+        if config.chat_group_context_enabled and self.type == "group":
+            lines = Chat.group_context.recent(
+                self.session_id,
+                config.chat_group_context_attach_lines,
+                config.chat_group_context_token_cap,
+            )
+            if lines:
+                context.append("## 群里最近的其他消息\n" + "\n".join(lines))
+        if not context:
+            return self.history.messages
+        return self.history.build("\n\n".join(context))
+
+    def _usage_ids(self, user_id: str | None) -> tuple[str | None, str | None]:
+        """(群号, QQ号), 私聊会话的会话ID就是QQ号"""
+        if self.type == "group":
+            return self.session_id, user_id
+        return None, user_id or self.session_id
+
+    def _apply_quota(self, route: Route, user_id: str | None = None) -> Route | None:
+        """超出当天额度时改用额度模型, 没有配置额度模型时返回`None`表示拒绝"""
+        group_id, user_id = self._usage_ids(user_id)
+        exceeded = (
+            group_id
+            and config.chat_quota_group_daily_tokens
+            and UsageTracker.used("group", group_id) >= config.chat_quota_group_daily_tokens
+        ) or (
+            user_id
+            and config.chat_quota_user_daily_tokens
+            and UsageTracker.used("user", user_id) >= config.chat_quota_user_daily_tokens
+        )
+        if not exceeded:
+            return route
+        model = config.chat_quota_model or config.chat_fast_model
+        if config.chat_quota_action == "refuse" or not model:
+            logger.info(f"会话 {self.session_id} 超出当天的额度, 拒绝请求")
+            return None
+        return Route("quota", model, route.score)
+
+    def _cache_request(
+        self, messages: List[Message], route: Route
+    ) -> tuple[str | None, List[Message]]:
+        """
+        本轮的缓存键与实际发送的消息, 未启用缓存时缓存键为`None`
+        会话的第一轮去掉群聊中的发送者昵称后再发送, 回复不会称呼提问者,
+        不同群里相同的问候可以共用回复
+        """
+        if Chat.response_cache is None or not self.cache_enabled:
+            return None, messages
+        conversation = [m for m in messages if m["role"] != "system"]
+        if len(conversation) == 1 and conversation[0]["role"] == "user":
+            # 附加的上下文(群消息、旧对话)也是系统消息, 有上下文时仍只能完全匹配
+            question = _SPEAKER_PREFIX.sub("", conversation[0]["content"], count=1)
+            messages = [m for m in messages if m["role"] == "system"]
+            messages.append({"role": "user", "content": question})
+        # 未指定模型时由路由器在所有后端中选择, 视为同一个模型
+        return make_key(route.model or "*", messages), messages
+
+    async def _send_request(
+        self,
+        messages: List[Message],
+        route: Route,
+        cache_key: str | None = None,
+        queue_wait: float = 0.0,
+        user_id: str | None = None,
+    ) -> str:
         """发送API请求并处理响应"""
-        Chat._session_dictionary[self.session_id]["last_activity_time"] = time.time()
-
         # 发送带有流式输出的请求
-        result = ""
+        builder = StreamBuilder()
+        pending: List[str] = []
+        """上次触发响应块事件之后收到的片段"""
+        start = last_trigger = time.monotonic()
+        first_token_time: float | None = None
+        usage = None
+        """接口在最后一个片段中返回的实际用量"""
         try:
-            response = await self.client.chat.completions.create(
-                model=Chat.get_model(),
-                messages=self.history,
-                stream=True,  # 启用流式输出
-            )
+            # 在最健康的后端上发起流式请求, 失败或首字过慢时切换到其他后端
+            try:
+                response = await Chat.router.open_stream(messages, model=route.model)
+            except Exception as e:
+                if route.name != "fast":
+                    raise
+                # 小模型不可用时退回默认模型
+                logger.warning(f"小模型请求失败, 改用默认模型: {e}")
+                route = Route("default", None, route.score)
+                response = await Chat.router.open_stream(messages)
 
             async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content
+                usage = getattr(chunk, "usage", None) or usage
+                chunk_message = chunk.choices[0].delta.content if chunk.choices else None
                 if chunk_message:
-                    result += chunk_message
-                    # 触发响应块事件
-                    await Chat.on_response_chunk.trigger(
-                        self.session_id, chunk_message, result
-                    )
-
-            result = result.strip()
-
-            # 触发响应完成事件
-            await Chat.on_response_received.trigger(self.session_id, result)
+                    builder.append(chunk_message)
+                    pending.append(chunk_message)
+                    now = time.monotonic()
+                    if first_token_time is None:
+                        first_token_time = now
+                    if now - last_trigger >= config.chat_chunk_event_interval:
+                        # 触发响应块事件, 间隔内的片段合并为一次
+                        await Chat.on_response_chunk.trigger(
+                            self.session_id, "".join(pending), builder
+                        )
+                        pending.clear()
+                        last_trigger = now
+            if pending:
+                await Chat.on_response_chunk.trigger(
+                    self.session_id, "".join(pending), builder
+                )
 
-            # 添加到历史记录
-            self.history.append({"role": "assistant", "content": result})
-            self._non_system_message_count += 1
-            return result
+            result = builder.text.strip()
+            UsageTracker.record(
+                *self._usage_ids(user_id), *_usage_tokens(messages, usage, result)
+            )
+            # 按 路线/模型 统计, 用于调整分流的阈值
+            self._record_metrics(
+                f"{route.name}/{response.backend.model}",
+                queue_wait,
+                start,
+                first_token_time,
+                result,
+            )
+            if cache_key and result and Chat.response_cache is not None:
+                Chat.response_cache.set(cache_key, result)
+            return await self._finish_response(result)
 
         except Exception as e:
             logger.error(f"API request failed: {e}")
             raise
 
+    def _record_metrics(
+        self,
+        model: str,
+        queue_wait: float,
+        start: float,
+        first_token_time: float | None,
+        result: str,
+    ):
+        end = time.monotonic()
+        tokens = estimate_tokens(result)
+        Telemetry.record("queue_wait", model, self.type, queue_wait)
+        Telemetry.record("latency", model, self.type, end - start)
+        Telemetry.record("output_tokens", model, self.type, tokens)
+        if first_token_time is not None:
+            Telemetry.record("ttft", model, self.type, first_token_time - start)
+            if end > first_token_time:
+                Telemetry.record(
+                    "tokens_per_second", model, self.type, tokens / (end - first_token_time)
+                )
+
+    async def _finish_response(self, result: str) -> str:
+        # 触发响应完成事件
+        await Chat.on_response_received.trigger(self.session_id, result)
+
+        # 添加到历史记录
+        self.history.append({"role": "assistant", "content": result})
+        self._non_system_message_count += 1
+        return result
+
+    def _compact_history(self):
+        evicted = self.history.compact()
+        if not evicted:
+            return
+        logger.debug(f"会话 {self.session_id} 淘汰了 {len(evicted)} 条历史")
+        if config.chat_memory_enabled:
+            self.memory.add_messages(evicted)
+        if not config.chat_history_summary:
+            return
+        self._evicted.extend(evicted)
+        if self._summary_task is None or self._summary_task.done():
+            self._summary_task = asyncio.create_task(self._summarize())
+
+    async def _summarize(self):
+        """在后台把淘汰的历史与已有摘要合并为新的摘要, 不占用本轮回复的时间"""
+        while self._evicted:
+            evicted, self._evicted = self._evicted, []
+            transcript = "\n".join(f"{m['role']}: {m['content']}" for m in evicted)
+            if self.history.summary:
+                transcript = f"已有摘要:\n{self.history.summary}\n\n新的对话记录:\n{transcript}"
+            messages: List[Message] = [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript},
+            ]
+            try:
+                # 与回复请求共用全局并发额度
+                async with Chat.scheduler.slot(self.session_id, self.type):
+                    _, response = await Chat.router.complete(
+                        messages,
+                        model=Chat._model,
+                        max_tokens=config.chat_history_summary_max_tokens,
+                    )
+            except Exception as e:
+                logger.error(f"会话 {self.session_id} 生成摘要失败: {e}")
+                return
+            summary = response.choices[0].message.content
+            tokens = _usage_tokens(messages, getattr(response, "usage", None), summary or "")
+            UsageTracker.record(*self._usage_ids(None), *tokens)
+            if summary:
+                self.history.set_summary(summary.strip())
+
     def clear_history(self):
-        self.history = []
+        """清空历史, 清空的对话仍保留在长期记忆中"""
+        if self._summary_task and not self._summary_task.done():
+            self._summary_task.cancel()
+        self._evicted = []
+        if config.chat_memory_enabled:
+            self.memory.add_messages(self.history.messages)
+        self.history.clear()
+
+    def forget(self):
+        """清空历史与长期记忆"""
+        self.clear_history()
+        self.memory.clear()
 
     def send_system(self, message: str):
         self.history.append({"role": "system", "content": message})
@@ -198,7 +781,12 @@ class Chat:
     2. "/ai clean/clear" 两个单词都可以, 清除历史记录
     3. "/ai status" 获取当前ai的状态
     4. "/ai show" 显示所有历史记录的缩略内容
-    5. 所有命令的最后一个参数如果是`me`, 则是目标是私有频道的ai, 否则是公共频道的ai, `me`参数在私聊中不可用(因为私聊中不存在公共频道)
+    5. "/ai cancel" 取消当前会话中正在生成的回复
+    6. "/ai stats" 查看各模型的延迟与输出速度统计(仅管理员)
+    7. "/ai cache on/off" 开启或关闭当前会话的回复缓存(需要在配置中启用缓存)
+    8. "/ai forget" 清空历史记录与长期记忆(只用"/ai clear"时, 清空的对话仍会作为长期记忆被想起)
+    9. "/ai usage" 查看当天用量最多的群与用户(仅管理员)
+    10. 所有命令的最后一个参数如果是`me`, 则是目标是私有频道的ai, 否则是公共频道的ai, `me`参数在私聊中不可用(因为私聊中不存在公共频道)
 
 ## ai的特殊使用规则:
 - 在群聊中直接at机器人然后说话, ai会在公共环境下聊天, 即大家一起聊天
@@ -210,8 +798,7 @@ class Chat:
 """
 
 
-@scheduler.scheduled_job("cron", hour="*/2", id="regular_chat_cleaning")
+@scheduler.scheduled_job("interval", minutes=1, id="regular_chat_cleaning")
 async def regular_cleaning():
-    nonebot.logger.info("定期清理聊天会话...")
-    Chat.clean_expired_session()
-    nonebot.logger.info("清理完成")
+    Chat.spill_idle_sessions()
+    UsageTracker.flush()
@@ -0,0 +1,61 @@
+from typing import Dict
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from nonebot.log import logger
+
+
+class ClientPool:
+    """
+    ### 进程内共享的 AsyncOpenAI 客户端
+    同一个接口地址与密钥只创建一个客户端, 所有会话复用其连接池与长连接, 避免每个会话各自握手
+    """
+
+    max_connections: int = 64
+    max_keepalive_connections: int = 16
+    keepalive_expiry: float = 60.0
+    timeout: float = 120.0
+    _clients: Dict[tuple[str, str], AsyncOpenAI] = {}
+    """(接口地址, 密钥) -> 客户端, 同一地址的不同密钥不能共用客户端"""
+
+    @classmethod
+    def configure(
+        cls,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+        timeout: float,
+    ):
+        cls.max_connections = max_connections
+        cls.max_keepalive_connections = max_keepalive_connections
+        cls.keepalive_expiry = keepalive_expiry
+        cls.timeout = timeout
+
+    @classmethod
+    def get_client(cls, base_url: str, api_key: str) -> AsyncOpenAI:
+        """获取接口地址与密钥对应的共享客户端, 不存在时创建"""
+        client = cls._clients.get((base_url, api_key))
+        if client is None:
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=cls.max_connections,
+                    max_keepalive_connections=cls.max_keepalive_connections,
+                    keepalive_expiry=cls.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(cls.timeout, connect=10.0),
+            )
+            client = AsyncOpenAI(
+                base_url=base_url, api_key=api_key, http_client=http_client
+            )
+            cls._clients[(base_url, api_key)] = client
+        return client
+
+    @classmethod
+    async def close_all(cls):
+        """关闭所有客户端及其连接池"""
+        for (base_url, _), client in cls._clients.items():
+            try:
+                await client.close()
+            except Exception as e:
+                logger.error(f"关闭客户端 {base_url} 失败: {e}")
+        cls._clients.clear()
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import re
+import time
+from typing import Any, Iterable
+
+from src.data.cache import LRUCache, MISSING
+from src.plugins.chat.history import Message
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(content: str) -> str:
+    """去掉首尾空白并把连续空白合并为一个空格"""
+    return _WHITESPACE.sub(" ", content).strip()
+
+
+def make_key(model: str, messages: Iterable[Message], **params: Any) -> str:
+    """由模型、采样参数与规范化后的历史计算缓存键"""
+    payload = json.dumps(
+        [
+            model,
+            sorted(params.items()),
+            [(m["role"], normalize(m["content"])) for m in messages],
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    ### 完全匹配的补全缓存
+    - 输入(模型、采样参数、历史)完全相同的请求直接返回上次的回复, 不再请求上游
+    - 条目有过期时间, 并按条目数与字节数做 LRU 淘汰
+    - 记录命中、未命中与写入次数
+    """
+
+    def __init__(self, ttl: float, max_items: int, max_bytes: int) -> None:
+        self.ttl = ttl
+        self._cache = LRUCache(max_items, max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: str) -> str | None:
+        value = self._cache.get(key)
+        if value is MISSING:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str):
+        self._cache.set(key, value, time.time() + self.ttl)
+        self.stores += 1
+
+    def clear(self):
+        self._cache.clear()
+
+    def summary(self) -> str:
+        return (
+            f"回复缓存: {len(self)}条, 命中 {self.hits}, 未命中 {self.misses}, "
+            f"命中率 {self.hit_rate:.0%}"
+        )
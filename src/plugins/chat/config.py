@@ -1,3 +1,5 @@
+from typing import Dict, List, Literal
+
 from pydantic import BaseModel, field_validator
 
 from src.priority_manager import PriorityManager
@@ -9,5 +11,129 @@ class Config(BaseModel):
     """命令插件的配置信息"""
 
     priority: int = pm.priority["chat"]
+    context_priority: int = pm.priority["chat_context"]
     command_priority: int = pm.priority["command"]
     enabled: bool = True
+
+    chat_base_url: str = "https://api.siliconflow.cn/v1"
+    """OpenAI 兼容接口的地址, 测试时可以指向本地的模拟服务"""
+    chat_max_connections: int = 64
+    """共享客户端的最大连接数"""
+    chat_max_keepalive_connections: int = 16
+    """共享客户端保持的空闲连接数"""
+    chat_keepalive_expiry: float = 60.0
+    """空闲连接的保持时间(秒)"""
+    chat_timeout: float = 120.0
+    """单次请求的超时时间(秒)"""
+
+    chat_backends: List[Dict[str, str]] = []
+    """
+    上游后端列表, 每项包含`name`、`base_url`、`model`, 可选`api_key`(默认使用`siliconflow_api_key`)
+    按顺序排列, 第一个为主后端, 为空时只使用`chat_base_url`上的默认模型
+    """
+    chat_fast_model: str | None = None
+    """简单的提问使用的小模型, 为空时不按复杂度分流; 不在`chat_backends`中时使用主后端的地址"""
+    chat_fast_route_threshold: float = 1.0
+    """提问的复杂度低于该值时使用小模型"""
+    chat_hedge_enabled: bool = True
+    """主后端迟迟没有返回内容时, 是否向下一个后端发出对冲请求"""
+    chat_hedge_min_delay: float = 1.0
+    """发出对冲请求前的最短等待时间(秒)"""
+    chat_hedge_max_delay: float = 8.0
+    """发出对冲请求前的最长等待时间(秒), 没有足够的延迟样本时使用该值"""
+
+    chat_history_token_budget: int = 6000
+    """每个会话历史的 token 预算, 超出后淘汰最早的对话"""
+    chat_history_summary: bool = True
+    """是否把淘汰的对话压缩为摘要"""
+    chat_history_summary_max_tokens: int = 400
+    """摘要请求的最大输出 token 数"""
+
+    chat_stream_reply: bool = False
+    """是否在生成过程中按句子分段发送回复"""
+    chat_stream_min_chars: int = 20
+    """流式发送时每段的最少字符数"""
+    chat_stream_max_chars: int = 300
+    """没有句子边界时, 缓冲达到该长度强制发送"""
+    chat_stream_interval: float = 1.0
+    """同一个群(或私聊)两次发送之间的最小间隔(秒)"""
+
+    chat_max_concurrency: int = 8
+    """同时进行的上游请求上限"""
+    chat_queue_deadline: float = 60.0
+    """请求排队的最长时间(秒), 超过后放弃请求"""
+    chat_private_weight: int = 3
+    """调度时私聊会话的权重"""
+    chat_group_weight: int = 1
+    """调度时群聊会话的权重"""
+    chat_deadline_reply: str = "现在找我聊天的人太多啦, 请稍后再试~"
+    """排队超时时的回复"""
+
+    chat_preempt_private: bool = False
+    """私聊中有新消息时取消仍在生成的旧回复"""
+
+    chat_chunk_event_interval: float = 0.2
+    """响应块事件的最小触发间隔(秒), 间隔内收到的片段合并为一次事件"""
+
+    chat_intent_router: bool = True
+    """节假日、汇率、掷点、算式等问题直接由本地引擎回答, 不请求大模型"""
+    chat_intent_rewrite: bool = False
+    """是否让大模型以人设的语气改写本地引擎的回答"""
+
+    chat_debounce_window: float = 0.0
+    """群聊中同一个人连续发送的消息在该时间(秒)内合并为一条, 为 0 时不合并"""
+    chat_debounce_max_wait: float = 5.0
+    """合并消息时从第一条消息开始最多等待的时间(秒)"""
+
+    chat_memory_enabled: bool = True
+    """把淘汰的历史写入会话的长期记忆, 并在提问时检索相关的旧对话放入提示"""
+    chat_memory_capacity: int = 128
+    """每个会话长期记忆的片段数上限, 超出后覆盖最早的片段"""
+    chat_memory_top_k: int = 3
+    """每轮最多放入提示的旧对话片段数"""
+    chat_memory_min_score: float = 0.2
+    """放入提示的片段与提问的最低相似度"""
+
+    chat_group_context_enabled: bool = True
+    """记录群里没有@机器人的消息, 回复时把最近的几条放入提示"""
+    chat_group_context_max_lines: int = 50
+    """每个群保留的消息条数"""
+    chat_group_context_max_chars: int = 200
+    """每条消息保留的最大字符数"""
+    chat_group_context_max_bytes: int = 2 * 1024 * 1024
+    """所有群的消息合计的字节数上限"""
+    chat_group_context_attach_lines: int = 15
+    """每轮最多放入提示的消息条数"""
+    chat_group_context_token_cap: int = 500
+    """放入提示的消息的 token 数上限"""
+
+    chat_quota_group_daily_tokens: int = 0
+    """每个群每天的 token 额度, 为 0 时不限制"""
+    chat_quota_user_daily_tokens: int = 0
+    """每个用户每天的 token 额度, 为 0 时不限制"""
+    chat_quota_action: Literal["degrade", "refuse"] = "degrade"
+    """超出额度后: `degrade` 改用额度模型, `refuse` 拒绝回复"""
+    chat_quota_model: str | None = None
+    """超出额度后使用的模型, 为空时使用`chat_fast_model`, 两者都为空时拒绝回复"""
+    chat_quota_reply: str = "今天聊得太多啦, 明天再来找我吧~"
+    """超出额度并拒绝回复时的回复"""
+
+    chat_session_idle_minutes: float = 30.0
+    """会话空闲超过该时长(分钟)后换出到磁盘, 下次使用时恢复"""
+    chat_max_sessions: int = 1000
+    """内存中保留的会话数上限, 超出时换出最久没有活动的会话"""
+    chat_session_spill_ttl: float = 7 * 24 * 3600
+    """换出的会话在磁盘上的保留时间(秒)"""
+
+    chat_cache_enabled: bool = False
+    """
+    是否缓存输入完全相同的请求的回复
+    - 会话第一轮的提问去掉群聊昵称后再请求, 不同群里相同的问候可以命中
+    - 附加了群聊上下文或旧对话时, 只有上下文也相同才能命中
+    """
+    chat_cache_ttl: float = 600.0
+    """缓存的回复的有效期(秒)"""
+    chat_cache_max_items: int = 512
+    """缓存的最大条目数"""
+    chat_cache_max_bytes: int = 2 * 1024 * 1024
+    """缓存的最大估算字节数"""
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Dict, Hashable, List
+
+
+class _Burst:
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.parts: List[str] = []
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.owner: object | None = None
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class Debouncer:
+    """
+    ### 连续消息防抖
+    同一个键在`window`秒内连续发送的消息合并为一条, 最后一条消息之后`window`秒内没有新消息时提交
+    - max_wait: 从第一条消息开始最多等待的时间, 超过后立即提交, 保证延迟有上限
+    """
+
+    def __init__(self, window: float, max_wait: float) -> None:
+        self.window = window
+        self.max_wait = max_wait
+        self._bursts: Dict[Hashable, _Burst] = {}
+
+    async def submit(self, key: Hashable, text: str) -> str | None:
+        """
+        加入当前的连续消息
+        #### :return: 合并后的消息, 只有最后一条消息的调用返回, 其余返回`None`
+        """
+        if self.window <= 0:
+            return text
+        loop = asyncio.get_running_loop()
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = self._bursts[key] = _Burst(loop.time())
+        burst.parts.append(text)
+        token = object()
+        burst.owner = token
+        if burst.timer:
+            burst.timer.cancel()
+        delay = min(self.window, burst.started + self.max_wait - loop.time())
+        burst.timer = loop.call_later(max(0.0, delay), self._fire, key, burst)
+        owner, merged = await asyncio.shield(burst.future)
+        return merged if owner is token else None
+
+    def _fire(self, key: Hashable, burst: _Burst):
+        if self._bursts.get(key) is burst:
+            del self._bursts[key]
+        if not burst.future.done():
+            burst.future.set_result((burst.owner, "\n".join(burst.parts)))
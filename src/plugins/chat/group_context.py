@@ -0,0 +1,77 @@
+import sys
+from collections import OrderedDict, deque
+from typing import Deque, List, NamedTuple
+
+from src.plugins.chat.history import estimate_tokens
+
+
+class _Line(NamedTuple):
+    nickname: str
+    text: str
+    size: int
+
+
+class GroupContextBuffer:
+    """
+    ### 群聊中最近的普通消息(没有@机器人的消息)
+    - 每个群一个环形缓冲区, 最多保留`max_lines`条, 每条最多`max_chars`个字符
+    - 所有群合计的字节数超过`max_bytes`时, 从最久没有消息的群开始丢弃最早的消息
+    - 昵称经过`sys.intern`, 同一个人的多条消息共用一个字符串
+    """
+
+    def __init__(self, max_lines: int, max_chars: int, max_bytes: int) -> None:
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.max_bytes = max_bytes
+        self._groups: OrderedDict[str, Deque[_Line]] = OrderedDict()
+        self.size = 0
+        """所有群的消息合计的字节数"""
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def add(self, group_id: str, nickname: str, text: str):
+        text = text.strip()[: self.max_chars]
+        if not text:
+            return
+        lines = self._groups.get(group_id)
+        if lines is None:
+            lines = self._groups[group_id] = deque()
+        else:
+            self._groups.move_to_end(group_id)
+        if len(lines) >= self.max_lines:
+            self.size -= lines.popleft().size
+        line = _Line(sys.intern(nickname), text, len(text.encode("utf-8")))
+        lines.append(line)
+        self.size += line.size
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._groups:
+            group_id, lines = next(iter(self._groups.items()))
+            self.size -= lines.popleft().size
+            if not lines:
+                del self._groups[group_id]
+
+    def recent(self, group_id: str, max_lines: int, token_cap: int) -> List[str]:
+        """群里最近的消息, 从最新的一条往前取, 不超过`max_lines`条与`token_cap`个 token"""
+        lines = self._groups.get(group_id)
+        if not lines:
+            return []
+        result: List[str] = []
+        tokens = 0
+        for line in reversed(lines):
+            if len(result) >= max_lines:
+                break
+            text = f"<{line.nickname}>: {line.text}"
+            tokens += estimate_tokens(text)
+            if tokens > token_cap:
+                break
+            result.append(text)
+        result.reverse()
+        return result
+
+    def clear(self, group_id: str):
+        lines = self._groups.pop(group_id, None)
+        if lines:
+            self.size -= sum(line.size for line in lines)
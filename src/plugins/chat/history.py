@@ -0,0 +1,148 @@
+import re
+from typing import Any, Dict, Iterator, List
+
+
+Message = Dict[str, str]
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+MESSAGE_OVERHEAD_TOKENS = 4
+"""每条消息的角色与格式开销"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数, 不依赖具体模型的分词器
+    - 中日韩字符与全角符号按每字 1 个 token 计
+    - 其余字符按每 4 个字符 1 个 token 计
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: Message) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ChatHistory:
+    """
+    ### 带 token 预算的聊天历史
+    - 每条消息写入时计算一次 token 数, 总数增量维护
+    - `system` 消息始终保留, 超出预算时从最早的对话轮次开始淘汰
+    - 被淘汰的轮次可以压缩为一段摘要, 以一条`system`消息放在系统提示之后
+    """
+
+    COMPACT_TARGET = 0.75
+    """淘汰后保留的 token 数占预算的比例, 留出余量避免每轮都要淘汰"""
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self._messages: List[Message] = []
+        self._tokens: List[int] = []
+        self.total_tokens = 0
+        self.summary: str | None = None
+        self._summary_tokens = 0
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self.messages)
+
+    def __len__(self) -> int:
+        return len(self._messages) + (1 if self.summary else 0)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    @property
+    def messages(self) -> List[Message]:
+        """发送给接口的消息列表, 摘要插入在开头的系统提示之后"""
+        return self.build()
+
+    def build(self, context: str | None = None) -> List[Message]:
+        """
+        构造发送给接口的消息列表
+        - context: 额外的背景信息(如检索到的旧对话), 以一条`system`消息放在摘要之后
+        """
+        extra: List[Message] = []
+        if self.summary:
+            extra.append({"role": "system", "content": f"## 之前的对话摘要\n{self.summary}"})
+        if context:
+            extra.append({"role": "system", "content": context})
+        if not extra:
+            return list(self._messages)
+        index = 0
+        while index < len(self._messages) and self._messages[index]["role"] == "system":
+            index += 1
+        return self._messages[:index] + extra + self._messages[index:]
+
+    @property
+    def prompt_tokens(self) -> int:
+        """当前历史(含摘要)的估算 token 数"""
+        return self.total_tokens + self._summary_tokens
+
+    def append(self, message: Message):
+        tokens = message_tokens(message)
+        self._messages.append(message)
+        self._tokens.append(tokens)
+        self.total_tokens += tokens
+
+    def clear(self):
+        self._messages.clear()
+        self._tokens.clear()
+        self.total_tokens = 0
+        self.set_summary(None)
+
+    def set_summary(self, summary: str | None):
+        self.summary = summary or None
+        self._summary_tokens = (
+            estimate_tokens(summary) + MESSAGE_OVERHEAD_TOKENS if summary else 0
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """可以JSON序列化的历史, 不含预算与 token 计数"""
+        return {"messages": self._messages, "summary": self.summary}
+
+    @classmethod
+    def from_dict(cls, budget: int, data: Dict[str, Any]) -> "ChatHistory":
+        history = cls(budget)
+        for message in data.get("messages", []):
+            history.append(message)
+        history.set_summary(data.get("summary"))
+        return history
+
+    def compact(self) -> List[Message]:
+        """
+        超出预算时从最早的对话轮次开始淘汰, 直到降到预算的`COMPACT_TARGET`以下
+        - 一轮是连续的用户消息与其后的回复, 整轮淘汰, 不会留下没有提问的回复
+        - `system`消息与本轮的提问(末尾连续的用户消息)不会被淘汰
+        #### :return: 被淘汰的消息, 按原顺序
+        """
+        if self.prompt_tokens <= self.budget:
+            return []
+        target = int(self.budget * self.COMPACT_TARGET)
+        messages = self._messages
+        protected = len(messages) - 1
+        while protected > 0 and messages[protected - 1]["role"] == "user":
+            protected -= 1
+        evicted_indexes: List[int] = []
+        total = self.total_tokens
+        index = 0
+        while index < protected and total + self._summary_tokens > target:
+            if messages[index]["role"] == "system":
+                index += 1
+                continue
+            end = index
+            while end < protected and messages[end]["role"] == "user":
+                end += 1
+            while end < protected and messages[end]["role"] not in ("user", "system"):
+                end += 1
+            for i in range(index, end):
+                evicted_indexes.append(i)
+                total -= self._tokens[i]
+            index = end
+        if not evicted_indexes:
+            return []
+        evicted_set = set(evicted_indexes)
+        evicted = [messages[i] for i in evicted_indexes]
+        self._messages = [m for i, m in enumerate(messages) if i not in evicted_set]
+        self._tokens = [t for i, t in enumerate(self._tokens) if i not in evicted_set]
+        self.total_tokens = total
+        return evicted
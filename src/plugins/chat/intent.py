@@ -0,0 +1,178 @@
+import datetime
+import re
+from typing import Awaitable, Callable, List, NamedTuple
+
+import simpleeval as se
+from nonebot.log import logger
+
+from src.plugins.dice.dice import DiceAction
+
+_TRAILING_PUNCTUATION = "?？!！。.~～呀呢啊吖 "
+
+MAX_INPUT_LENGTH = 200
+"""超过该长度的消息不尝试本地回答"""
+MAX_DICE = 100
+"""本地掷点允许的最多骰子数"""
+MAX_SIDES = 1000
+"""本地掷点允许的最大面数"""
+
+
+class Intent(NamedTuple):
+    name: str
+    pattern: re.Pattern[str]
+    handler: Callable[[re.Match[str]], Awaitable[str | None]]
+    """处理匹配的消息, 返回`None`时交给大模型回答"""
+
+
+_RELATIVE_DAYS = {"今天": 0, "明天": 1, "后天": 2}
+_MONTH_DAY = re.compile(r"(?:(?P<year>\d{4})年)?(?P<month>\d{1,2})月(?P<day>\d{1,2})[日号]")
+
+
+def _parse_date(text: str) -> datetime.date | None:
+    """解析 今天/明天/后天 与 `[YYYY年]M月D日`, 无法解析时返回`None`"""
+    today = datetime.date.today()
+    if text in _RELATIVE_DAYS:
+        return today + datetime.timedelta(days=_RELATIVE_DAYS[text])
+    match = _MONTH_DAY.fullmatch(text)
+    if match is None:
+        return None
+    year = int(match.group("year") or today.year)
+    try:
+        return datetime.date(year, int(match.group("month")), int(match.group("day")))
+    except ValueError:
+        return None
+
+
+async def _holiday(match: re.Match[str]) -> str | None:
+    # 在用到时才导入命令插件, 聊天插件加载时不依赖汇率接口的配置
+    from src.plugins.command.scr.holidays import HolidayCalculation as HolidayCal
+
+    text = match.group("date")
+    if not text:
+        return HolidayCal.get_next_holiday()
+    date = _parse_date(text)
+    if date is None:
+        return None
+    # 普通的周末交给大模型回答
+    return HolidayCal.get_holiday(date, including_weekends=False)
+
+
+async def _currency(match: re.Match[str]) -> str | None:
+    from src.plugins.command.scr.calculator.currencyCal import CurrencyParse
+
+    parse = CurrencyParse(f"{match.group('amount')}{match.group('src')}>{match.group('dst')}")
+    if not parse.done:
+        # 不认识的货币名, 可能并不是在问汇率
+        return None
+    return await parse.aconvert()
+
+
+_DICE_TOKEN = re.compile(r"(\d*)d(\d+)", re.I)
+
+
+async def _dice(match: re.Match[str]) -> str | None:
+    expression = re.sub(r"\s+", "", match.group("dice")).lower()
+    for count, sides in _DICE_TOKEN.findall(expression):
+        if not 1 <= int(count or 1) <= MAX_DICE or not 1 <= int(sides) <= MAX_SIDES:
+            return None
+    # DiceAction 要求骰子数不能省略, `d6` => `1d6`
+    expression = re.sub(r"(?<!\d)d", "1d", expression)
+    return f"{expression} 的掷点结果是: {DiceAction(expression).result}"
+
+
+_ARITHMETIC = se.SimpleEval()
+_ARITHMETIC_SYMBOLS = str.maketrans({"×": "*", "÷": "/", "^": "**", "（": "(", "）": ")"})
+_OPERAND = r"(?:[(（]\s*)*-?\d+(?:\.\d+)?(?:\s*[)）])*"
+"""算式中的一个数, 可以带左右括号"""
+_DATE_LIKE = re.compile(
+    r"\d{4}\s*([-/])\s*\d{1,2}(?:\s*\1\s*\d{1,2})?"
+    r"|\d{1,2}\s*([-/])\s*\d{1,2}\s*\2\s*\d{4}"
+)
+"""`2024-10-1`、`10/1/2024` 这类日期, 没有追问时不当作算式"""
+
+
+async def _arithmetic(match: re.Match[str]) -> str | None:
+    expr = match.group("expr").strip()
+    if not match.group("ask").strip() and _DATE_LIKE.fullmatch(expr):
+        return None
+    try:
+        result = _ARITHMETIC.eval(expr.translate(_ARITHMETIC_SYMBOLS))
+        if isinstance(result, float) and result.is_integer():
+            result = int(result)
+        # 结果过大时格式化也会失败(整数位数超过限制)
+        return f"{expr} = {result}"
+    except Exception:
+        return None
+
+
+class IntentRouter:
+    """
+    ### 本地意图路由
+    用预编译的正则识别本地引擎就能回答的问题, 直接在本地回答, 不请求大模型
+    - holiday: "明天放假吗"、"下个假期是什么时候"
+    - currency: "100美元多少人民币"
+    - dice: "roll 2d6+3"
+    - arithmetic: "3*(4+5)等于多少"
+    """
+
+    INTENTS: List[Intent] = [
+        Intent(
+            "dice",
+            re.compile(
+                r"(?:roll|r|掷|投|丢)\s*(?P<dice>\d*d\d+(?:\s*[+-]\s*(?:\d*d\d+|\d+))*)",
+                re.I,
+            ),
+            _dice,
+        ),
+        Intent(
+            "arithmetic",
+            re.compile(
+                # 每个位置只有一种匹配方式, 避免回溯爆炸: 数 (运算符 数)+, 括号贴在数的两侧
+                rf"(?P<expr>{_OPERAND}(?:\s*(?:\*\*|[-+*/%×÷^])\s*{_OPERAND})+)"
+                r"\s*(?P<ask>(?:(?:[=＝]|等于|是)\s*)?(?:多少|几)?)"
+            ),
+            _arithmetic,
+        ),
+        Intent(
+            "currency",
+            re.compile(
+                r"(?P<amount>\d+(?:\.\d+)?)\s*(?P<src>[一-龥A-Za-z]{1,10}?)\s*"
+                r"(?:是|等于|能换|可以换|换|换成|换算成|兑换|兑换成|合|折合|值)?\s*多少"
+                r"\s*(?P<dst>[一-龥A-Za-z]{1,10})"
+            ),
+            _currency,
+        ),
+        Intent(
+            "holiday",
+            re.compile(
+                r"(?P<date>今天|明天|后天|\d{4}年\d{1,2}月\d{1,2}[日号]|\d{1,2}月\d{1,2}[日号])?"
+                r"(?:是不是(?:放假|休息|节假日|假期|调休)|是?(?:放假|休息|节假日|假期|调休)(?:吗|么|嘛))"
+                r"|(?:还有几天|多久|什么时候|啥时候)(?:才)?(?:放假|放假期|到假期)"
+                r"|下(?:一)?个(?:假期|节假日)(?:是)?(?:什么时候|哪天|是啥|是什么)?"
+            ),
+            _holiday,
+        ),
+    ]
+    """按顺序尝试, 整条消息(去掉结尾的语气词与标点)必须完全匹配"""
+
+    async def route(self, text: str) -> tuple[str, str] | None:
+        """
+        尝试在本地回答消息
+        #### :return: (意图名, 回答), 没有匹配的意图时返回`None`
+        """
+        text = text.strip().rstrip(_TRAILING_PUNCTUATION)
+        if not text or len(text) > MAX_INPUT_LENGTH:
+            return None
+        for intent in self.INTENTS:
+            match = intent.pattern.fullmatch(text)
+            if match is None:
+                continue
+            try:
+                answer = await intent.handler(match)
+            except Exception as e:
+                # 本地引擎无法回答(如超出节假日数据的年份), 交给大模型
+                logger.warning(f"本地意图处理失败 [intent:{intent.name}]: {e!r}")
+                continue
+            if answer is not None:
+                return intent.name, answer
+        return None
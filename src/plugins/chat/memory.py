@@ -0,0 +1,119 @@
+import math
+import zlib
+from array import array
+from operator import mul
+from typing import Dict, Iterable, List
+
+from src.plugins.chat.history import Message
+
+VECTOR_DIM = 256
+"""哈希向量的维度"""
+NGRAM_SIZES = (1, 2, 3)
+"""使用的字符 n-gram 长度"""
+
+
+def embed(text: str, dim: int = VECTOR_DIM) -> array:
+    """
+    把文本转为单位长度的 float32 向量
+    字符 n-gram 经 crc32 哈希到固定维度(不随进程变化), 符号由哈希的高位决定, 以抵消冲突
+    """
+    vector = array("f", bytes(4 * dim))
+    text = text.lower()
+    for n in NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            gram = text[i : i + n]
+            if gram.isspace():
+                continue
+            hashed = zlib.crc32(gram.encode("utf-8"))
+            vector[hashed % dim] += 1.0 if hashed & 0x80000000 else -1.0
+    norm = math.sqrt(sum(map(mul, vector, vector)))
+    if norm:
+        for i in range(dim):
+            vector[i] /= norm
+    return vector
+
+
+class MemoryIndex:
+    """
+    ### 会话的长期记忆
+    - 从历史中淘汰的对话以片段形式保存, 每个片段对应一个 float32 哈希向量
+    - 所有向量连续存放在一个`array`中, 按余弦相似度检索最相关的片段
+    - 片段数达到`capacity`后覆盖最早的片段, 内存占用有上限
+    """
+
+    def __init__(self, capacity: int, dim: int = VECTOR_DIM) -> None:
+        self.capacity = capacity
+        self.dim = dim
+        self._snippets: List[str] = []
+        self._vectors = array("f")
+        self._next = 0
+        """写满后下一个被覆盖的位置"""
+
+    def __len__(self) -> int:
+        return len(self._snippets)
+
+    def add(self, snippet: str):
+        vector = embed(snippet, self.dim)
+        if len(self._snippets) < self.capacity:
+            self._snippets.append(snippet)
+            self._vectors.extend(vector)
+            return
+        slot = self._next
+        self._snippets[slot] = snippet
+        self._vectors[slot * self.dim : (slot + 1) * self.dim] = vector
+        self._next = (slot + 1) % self.capacity
+
+    def add_messages(self, messages: Iterable[Message]):
+        """把淘汰的消息按轮次(提问与紧随其后的回答)合并为片段写入"""
+        turn: List[str] = []
+        for message in messages:
+            if message["role"] == "system":
+                continue
+            if message["role"] == "user" and turn:
+                self.add("\n".join(turn))
+                turn = []
+            prefix = "Erin: " if message["role"] == "assistant" else ""
+            turn.append(prefix + message["content"])
+        if turn:
+            self.add("\n".join(turn))
+
+    def search(self, query: str, k: int, min_score: float = 0.0) -> List[str]:
+        """
+        检索与`query`最相关的片段
+        #### :return: 相似度不低于`min_score`的前`k`个片段, 按写入的先后排列
+        """
+        if not self._snippets or not query.strip():
+            return []
+        query_vector = embed(query, self.dim)
+        view = memoryview(self._vectors)
+        dim = self.dim
+        scores = [
+            (sum(map(mul, query_vector, view[i * dim : (i + 1) * dim])), i)
+            for i in range(len(self._snippets))
+        ]
+        top = sorted(
+            (item for item in scores if item[0] >= min_score), reverse=True
+        )[:k]
+        # 写满后最早的片段位于`_next`
+        count = len(self._snippets)
+        order = sorted((i - self._next) % count for _, i in top)
+        return [self._snippets[(i + self._next) % count] for i in order]
+
+    def clear(self):
+        self._snippets.clear()
+        self._vectors = array("f")
+        self._next = 0
+
+    def to_dict(self) -> Dict[str, object]:
+        """只保存片段, 载入时重新计算向量"""
+        return {"snippets": self._snippets, "next": self._next}
+
+    @classmethod
+    def from_dict(cls, capacity: int, data: Dict[str, object]) -> "MemoryIndex":
+        index = cls(capacity)
+        snippets = list(data.get("snippets", []))[-capacity:]  # type: ignore
+        for snippet in snippets:
+            index.add(snippet)
+        if len(snippets) == capacity:
+            index._next = int(data.get("next", 0)) % capacity  # type: ignore
+        return index
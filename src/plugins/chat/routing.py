@@ -0,0 +1,58 @@
+import re
+from typing import NamedTuple
+
+from src.plugins.chat.history import estimate_tokens
+
+_REASONING = re.compile(
+    r"为什么|为啥|怎么|如何|解释|分析|比较|区别|原理|证明|推导|总结|翻译|写一|帮我写|代码|"
+    r"步骤|方案|建议|计划|why|how|explain|code|write",
+    re.I,
+)
+"""通常需要推理或较长回答的提问"""
+_CODE_OR_MATH = re.compile(r"```|[{};=<>]|\b(def|class|import|select|function)\b|\d+\s*[-+*/^]\s*\d+", re.I)
+_QUESTION = re.compile(r"[?？]")
+
+
+class Route(NamedTuple):
+    name: str
+    """路线名: `fast` 或 `default`"""
+    model: str | None
+    """使用的模型, `None`表示由后端路由器在所有后端中选择"""
+    score: float
+
+
+def estimate_complexity(question: str, history_tokens: int = 0) -> float:
+    """
+    粗略估计提问的复杂度, 大约以 1.0 为"需要大模型"的分界
+    - 提问每 40 个 token 计 1 分
+    - 含有推理类关键词计 1 分, 含有代码或算式计 0.5 分, 多个问句计 0.5 分
+    - 历史每 4000 个 token 计 1 分
+    """
+    score = estimate_tokens(question) / 40
+    if _REASONING.search(question):
+        score += 1.0
+    if _CODE_OR_MATH.search(question):
+        score += 0.5
+    if len(_QUESTION.findall(question)) > 1:
+        score += 0.5
+    return score + history_tokens / 4000
+
+
+class ComplexityRouter:
+    """
+    ### 按提问的复杂度选择模型
+    复杂度低于`threshold`的提问交给响应更快的小模型, 其余交给默认模型
+    `fast_model`为`None`时不分流
+    """
+
+    def __init__(self, fast_model: str | None, threshold: float) -> None:
+        self.fast_model = fast_model
+        self.threshold = threshold
+
+    def route(self, question: str, history_tokens: int = 0) -> Route:
+        if not self.fast_model:
+            return Route("default", None, 0.0)
+        score = estimate_complexity(question, history_tokens)
+        if score < self.threshold:
+            return Route("fast", self.fast_model, score)
+        return Route("default", None, score)
@@ -0,0 +1,154 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Literal
+
+
+SessionType = Literal["group", "private"]
+
+
+class DeadlineExceeded(Exception):
+    """请求排队超过期限"""
+
+
+class RequestScheduler:
+    """
+    ### 全局大模型请求调度
+    - 限制同时进行的上游请求数量
+    - 排队的请求按会话做平滑加权轮询, 私聊权重更高且同权时优先
+    - 排队超过期限的请求被丢弃, 由调用方给出简短回复
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        deadline: float = 60.0,
+        private_weight: int = 3,
+        group_weight: int = 1,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.weights: Dict[SessionType, int] = {
+            "private": private_weight,
+            "group": group_weight,
+        }
+        self.running = 0
+        """正在进行的请求数"""
+        self._queues: Dict[str, Deque[asyncio.Future]] = {}
+        self._types: Dict[str, SessionType] = {}
+        self._current: Dict[str, int] = {}
+        """平滑加权轮询中各会话的当前权重"""
+
+    @property
+    def waiting(self) -> int:
+        """排队中的请求数"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    @asynccontextmanager
+    async def slot(self, session_id: str, type: SessionType) -> AsyncIterator[None]:
+        """占用一个请求名额, 退出时释放"""
+        await self.acquire(session_id, type)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, session_id: str, type: SessionType):
+        """
+        等待一个请求名额
+        #### :raise DeadlineExceeded: 排队超过期限
+        """
+        if self.running < self.max_concurrency and not self._queues:
+            self.running += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session_id, deque()).append(future)
+        self._types[session_id] = type
+        self._current.setdefault(session_id, 0)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.deadline)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # 超时的同时获得了名额
+                return
+            self._discard(session_id, future)
+            raise DeadlineExceeded(f"会话 {session_id} 排队超过 {self.deadline} 秒")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._discard(session_id, future)
+            raise
+
+    def release(self):
+        self.running -= 1
+        self._wake()
+
+    def position(self, session_id: str) -> int | None:
+        """会话中最早的排队请求在调度顺序中的位置(从1开始), 没有排队时返回`None`"""
+        if session_id not in self._queues:
+            return None
+        counts = {sid: len(queue) for sid, queue in self._queues.items()}
+        current = dict(self._current)
+        position = 0
+        while counts:
+            position += 1
+            picked = self._pick_from(counts, current)
+            if picked == session_id:
+                return position
+            counts[picked] -= 1
+            if counts[picked] == 0:
+                del counts[picked]
+                del current[picked]
+        return None
+
+    def _wake(self):
+        while self.running < self.max_concurrency and self._queues:
+            session_id = self._pick_from(self._queues, self._current)
+            queue = self._queues[session_id]
+            future = queue.popleft()
+            if not queue:
+                self._remove_session(session_id)
+            if future.done():
+                continue
+            self.running += 1
+            future.set_result(None)
+
+    def _pick_from(self, sessions, current: Dict[str, int]) -> str:
+        """平滑加权轮询选出下一个会话, 会更新`current`"""
+        total = 0
+        best: str | None = None
+        for session_id in sessions:
+            weight = self.weights[self._types[session_id]]
+            current[session_id] += weight
+            total += weight
+            if (
+                best is None
+                or current[session_id] > current[best]
+                or (
+                    current[session_id] == current[best]
+                    and self._types[session_id] == "private"
+                )
+            ):
+                best = session_id
+        if best is None:
+            raise ValueError("没有可调度的会话")
+        current[best] -= total
+        return best
+
+    def _discard(self, session_id: str, future: asyncio.Future):
+        future.cancel()
+        queue = self._queues.get(session_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            self._remove_session(session_id)
+
+    def _remove_session(self, session_id: str):
+        del self._queues[session_id]
+        self._current.pop(session_id, None)
+        self._types.pop(session_id, None)
@@ -0,0 +1,43 @@
+import base64
+import json
+import zlib
+from typing import Any, Dict
+
+from src.data.data import DataManager
+
+SESSION_KEY_PREFIX = "chat:session:"
+"""换出的会话在 DataManager 中的键前缀"""
+
+
+def encode_state(state: Dict[str, Any]) -> str:
+    """把会话状态压缩为 zlib + base64 字符串"""
+    raw = json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+
+
+def decode_state(data: str) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(base64.b64decode(data)).decode("utf-8"))
+
+
+class SessionStore:
+    """
+    ### 空闲会话的磁盘存储
+    会话状态压缩后写入 DataManager, 由其负责批量写回与过期清理
+    """
+
+    @staticmethod
+    def save(session_id: str, state: Dict[str, Any], ttl: float | None = None):
+        DataManager.set(SESSION_KEY_PREFIX + session_id, encode_state(state), ttl=ttl)
+
+    @staticmethod
+    def load(session_id: str) -> Dict[str, Any] | None:
+        """取出换出的会话, 取出后从存储中删除"""
+        key = SESSION_KEY_PREFIX + session_id
+        data = DataManager.get(key, "")
+        if not data:
+            return None
+        DataManager.remove(key)
+        try:
+            return decode_state(data)
+        except (ValueError, zlib.error):
+            return None
@@ -0,0 +1,160 @@
+import asyncio
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from nonebot.log import logger
+
+
+class StreamBuilder:
+    """
+    ### 流式输出的累积器
+    只追加片段, 需要完整文本时才拼接一次, 避免每个片段都复制整段字符串
+    """
+
+    def __init__(self) -> None:
+        self._parts: List[str] = []
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return self.text
+
+    def append(self, part: str):
+        self._parts.append(part)
+        self._length += len(part)
+
+    @property
+    def text(self) -> str:
+        """拼接后的完整文本"""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+
+class SentenceBuffer:
+    """
+    ### 按句子边界切分流式输出
+    - 在句末标点、换行或段落处切分, 每段至少`min_chars`个字符
+    - 缓冲超过`max_chars`仍没有边界时强制切分
+    """
+
+    _BOUNDARY = re.compile(r"\n\s*\n|[。！？!?；;…~～]+[”’」』）)\]]*|\n")
+
+    def __init__(self, min_chars: int = 20, max_chars: int = 300) -> None:
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._text = ""
+
+    def feed(self, chunk: str) -> List[str]:
+        """写入一段输出, 返回可以发送的完整片段"""
+        self._text += chunk
+        segments = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            segment, self._text = self._text[:cut].strip(), self._text[cut:]
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self) -> str:
+        """取出剩余的全部内容"""
+        text, self._text = self._text.strip(), ""
+        return text
+
+    def _find_cut(self) -> int | None:
+        cut = None
+        for match in self._BOUNDARY.finditer(self._text):
+            # 边界之后还有内容时才切分, 避免把紧随其后的标点(如引号)分到下一段
+            if match.end() >= len(self._text) or match.end() > self.max_chars:
+                break
+            if match.end() >= self.min_chars:
+                cut = match.end()
+        if cut is None and len(self._text) >= self.max_chars:
+            cut = self.max_chars
+        return cut
+
+
+class RateLimiter:
+    """按键(群号或QQ号)限制发送间隔"""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._next_slot: Dict[str, float] = {}
+
+    def reserve(self, key: str) -> float:
+        """预约下一次发送, 返回需要等待的秒数"""
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(key, 0.0))
+        self._next_slot[key] = slot + self.interval
+        if len(self._next_slot) > 4096:
+            # 清理早已过期的预约, 保持内存有界
+            self._next_slot = {k: v for k, v in self._next_slot.items() if v > now}
+        return slot - now
+
+
+class StreamReply:
+    """
+    ### 一次回复的流式发送
+    `feed`不会阻塞, 片段由后台任务按限流间隔发送, 等待期间到达的片段合并为一条消息
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[Any]],
+        key: str,
+        limiter: RateLimiter,
+        min_chars: int = 20,
+        max_chars: int = 300,
+    ) -> None:
+        self.key = key
+        self.sent_count = 0
+        """已发送的消息条数"""
+        self._send = send
+        self._limiter = limiter
+        self._buffer = SentenceBuffer(min_chars, max_chars)
+        self._queue: List[str] = []
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    def feed(self, chunk: str):
+        for segment in self._buffer.feed(chunk):
+            self._push(segment)
+
+    async def close(self):
+        """发送剩余内容并等待全部发送完成"""
+        rest = self._buffer.flush()
+        if rest:
+            self._push(rest)
+        self._closed = True
+        self._ready.set()
+        await self._task
+
+    def cancel(self):
+        self._closed = True
+        self._task.cancel()
+
+    def _push(self, segment: str):
+        self._queue.append(segment)
+        self._ready.set()
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            if self._queue:
+                await asyncio.sleep(self._limiter.reserve(self.key))
+                text = "".join(self._queue)
+                self._queue.clear()
+                try:
+                    await self._send(text)
+                    self.sent_count += 1
+                except Exception as e:
+                    logger.error(f"流式发送失败 [{self.key}]: {e}")
+            if self._closed and not self._queue:
+                return
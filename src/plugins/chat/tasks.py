@@ -0,0 +1,80 @@
+import asyncio
+from typing import Dict, List, Set
+
+from nonebot.log import logger
+
+
+class TaskRegistry:
+    """
+    ### 聊天任务登记表
+    任务结束时通过回调自动移除, 可以按会话取消
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._sessions: Dict[str, Dict[str, asyncio.Task]] = {}
+        self._cancel_requested: Set[str] = set()
+        """通过登记表请求取消的任务ID, 用于区分任务本身被取消与等待它的协程被取消"""
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def add(self, session_id: str, task_id: str, task: asyncio.Task):
+        self._tasks[task_id] = task
+        self._sessions.setdefault(session_id, {})[task_id] = task
+        task.add_done_callback(lambda _: self._discard(session_id, task_id))
+
+    def session_tasks(self, session_id: str) -> List[asyncio.Task]:
+        return list(self._sessions.get(session_id, {}).values())
+
+    def cancel_session_nowait(self, session_id: str) -> int:
+        """请求取消会话中的所有任务, 不等待任务结束, 返回取消的任务数"""
+        tasks = {
+            task_id: task
+            for task_id, task in self._sessions.get(session_id, {}).items()
+            if not task.done()
+        }
+        for task_id, task in tasks.items():
+            self._cancel_requested.add(task_id)
+            task.cancel()
+        return len(tasks)
+
+    def cancel_requested(self, task_id: str) -> bool:
+        """任务是否通过登记表被取消"""
+        return task_id in self._cancel_requested
+
+    def clear_cancel_request(self, task_id: str):
+        """由等待任务的一方在处理完结果后调用"""
+        self._cancel_requested.discard(task_id)
+
+    async def cancel_session(self, session_id: str) -> int:
+        """取消会话中的所有任务并等待结束, 返回取消的任务数"""
+        return await self._cancel(self._sessions.get(session_id, {}))
+
+    async def cancel_all(self) -> int:
+        """取消所有任务并等待结束, 返回取消的任务数"""
+        return await self._cancel(self._tasks)
+
+    async def _cancel(self, tasks: Dict[str, asyncio.Task]) -> int:
+        count = 0
+        for task_id, task in list(tasks.items()):
+            if task.done():
+                continue
+            self._cancel_requested.add(task_id)
+            task.cancel()
+            count += 1
+            try:
+                await task
+            except asyncio.CancelledError:
+                logger.info(f"Task {task_id} cancelled")
+            except Exception as e:
+                logger.error(f"Error cancelling task {task_id}: {e}")
+        return count
+
+    def _discard(self, session_id: str, task_id: str):
+        self._tasks.pop(task_id, None)
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.pop(task_id, None)
+            if not session:
+                del self._sessions[session_id]
@@ -0,0 +1,122 @@
+import math
+from typing import Dict, List, Tuple
+
+
+class Histogram:
+    """
+    ### 对数分桶的流式直方图
+    - 桶的边界按`growth`等比增长, 分位数的相对误差不超过`growth - 1`
+    - 内存只与桶的数量有关, 与记录的样本数无关
+    - 超出范围的值记入两端的桶
+    """
+
+    def __init__(
+        self, min_value: float = 1e-3, max_value: float = 1e5, growth: float = 1.05
+    ) -> None:
+        self.min_value = min_value
+        self._log_growth = math.log(growth)
+        self._counts: List[int] = [0] * (
+            int(math.log(max_value / min_value) / self._log_growth) + 2
+        )
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        index = int(math.log(value / self.min_value) / self._log_growth) + 1
+        return min(index, len(self._counts) - 1)
+
+    def _value(self, index: int) -> float:
+        """桶的代表值(上下边界的几何中点)"""
+        if index == 0:
+            return self.min_value
+        return self.min_value * math.exp((index - 0.5) * self._log_growth)
+
+    def record(self, value: float):
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """分位数, `q`取值为 0 ~ 1"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+
+MetricKey = Tuple[str, str, str]
+"""(指标, 模型, 会话类型)"""
+
+
+class Telemetry:
+    """
+    ### 聊天性能指标
+    按 指标 × 模型 × 会话类型(group/private) 分别记录直方图
+    - queue_wait: 排队等待上游并发额度的时间(秒)
+    - ttft: 发出请求到收到第一个片段的时间(秒)
+    - latency: 上游请求的总耗时(秒)
+    - output_tokens: 回复的估算 token 数
+    - tokens_per_second: 首字之后的输出速度
+    - reply: 从收到消息到回复完成的时间(秒), 包含排队与合并等待
+    """
+
+    METRICS = {
+        "queue_wait": "s",
+        "ttft": "s",
+        "latency": "s",
+        "output_tokens": "",
+        "tokens_per_second": "/s",
+        "reply": "s",
+    }
+    """指标名 -> 单位"""
+
+    _histograms: Dict[MetricKey, Histogram] = {}
+
+    @classmethod
+    def record(cls, metric: str, model: str, session_type: str, value: float):
+        key = (metric, model, session_type)
+        histogram = cls._histograms.get(key)
+        if histogram is None:
+            histogram = cls._histograms[key] = Histogram()
+        histogram.record(value)
+
+    @classmethod
+    def get(cls, metric: str, model: str, session_type: str) -> Histogram | None:
+        return cls._histograms.get((metric, model, session_type))
+
+    @classmethod
+    def reset(cls):
+        cls._histograms.clear()
+
+    @classmethod
+    def report(cls) -> str:
+        """按模型与会话类型输出各指标的 p50/p95/p99"""
+        if not cls._histograms:
+            return "暂无统计数据"
+        groups = sorted({(model, type) for _, model, type in cls._histograms})
+        lines = []
+        for model, session_type in groups:
+            lines.append(f"[{model} | {session_type}]")
+            for metric, unit in cls.METRICS.items():
+                histogram = cls._histograms.get((metric, model, session_type))
+                if histogram is None:
+                    continue
+                p50, p95, p99 = (histogram.percentile(q) for q in (0.5, 0.95, 0.99))
+                lines.append(
+                    f"- {metric}: p50 {p50:.2f}{unit}, p95 {p95:.2f}{unit}, "
+                    f"p99 {p99:.2f}{unit} (n={histogram.count})"
+                )
+        return "\n".join(lines)
@@ -0,0 +1,99 @@
+import datetime
+import heapq
+from typing import Dict, List, Literal, Set, Tuple
+
+from src.data.data import DataManager
+
+USAGE_KEY_PREFIX = "chat:usage:"
+"""每日用量在 DataManager 中的键前缀, 后接日期"""
+
+Scope = Literal["group", "user"]
+Counter = List[int]
+"""[输入 token, 输出 token, 请求数]"""
+
+
+class UsageTracker:
+    """
+    ### 按群与用户统计的 token 用量
+    - 每天一份计数: 范围(group/user) -> ID -> [输入 token, 输出 token, 请求数]
+    - 记录时只修改内存中的计数, 由`flush`定期把当天有变化的计数批量写入 DataManager
+    - 启动后第一次记录某天的用量时, 从 DataManager 载入之前保存的计数
+    """
+
+    RETENTION_DAYS = 90
+    """每日用量的保留天数"""
+
+    _days: Dict[str, Dict[Scope, Dict[str, Counter]]] = {}
+    _dirty: Set[str] = set()
+    """有未写入修改的日期"""
+
+    @staticmethod
+    def today() -> str:
+        return datetime.date.today().isoformat()
+
+    @classmethod
+    def _day(cls, day: str) -> Dict[Scope, Dict[str, Counter]]:
+        usage = cls._days.get(day)
+        if usage is None:
+            saved = DataManager.get(USAGE_KEY_PREFIX + day, {})
+            # 复制一份, 避免修改 DataManager 缓存中的对象
+            usage = {
+                scope: {id: list(counter) for id, counter in saved.get(scope, {}).items()}
+                for scope in ("group", "user")
+            }
+            cls._days[day] = usage
+            # 只在内存中保留最近两天的计数
+            for old in sorted(cls._days)[:-2]:
+                if old not in cls._dirty:
+                    del cls._days[old]
+        return usage
+
+    @classmethod
+    def record(
+        cls,
+        group_id: str | None,
+        user_id: str | None,
+        prompt_tokens: int,
+        completion_tokens: int,
+    ):
+        day = cls.today()
+        usage = cls._day(day)
+        for scope, id in (("group", group_id), ("user", user_id)):
+            if not id:
+                continue
+            counter = usage[scope].get(id)
+            if counter is None:
+                counter = usage[scope][id] = [0, 0, 0]
+            counter[0] += prompt_tokens
+            counter[1] += completion_tokens
+            counter[2] += 1
+        cls._dirty.add(day)
+
+    @classmethod
+    def used(cls, scope: Scope, id: str, day: str | None = None) -> int:
+        """当天已使用的总 token 数"""
+        counter = cls._day(day or cls.today())[scope].get(id)
+        return counter[0] + counter[1] if counter else 0
+
+    @classmethod
+    def top(
+        cls, scope: Scope, n: int = 10, day: str | None = None
+    ) -> List[Tuple[str, Counter]]:
+        """当天用量最多的`n`个群或用户"""
+        usage = cls._day(day or cls.today())[scope]
+        return heapq.nlargest(n, usage.items(), key=lambda item: item[1][0] + item[1][1])
+
+    @classmethod
+    def flush(cls):
+        """把有变化的计数写入 DataManager, 由其负责批量写回"""
+        if not cls._dirty:
+            return
+        items = {
+            USAGE_KEY_PREFIX + day: {
+                scope: {id: list(counter) for id, counter in counters.items()}
+                for scope, counters in cls._days[day].items()
+            }
+            for day in cls._dirty
+        }
+        DataManager.set_many(items, ttl=cls.RETENTION_DAYS * 24 * 3600)
+        cls._dirty.clear()
@@ -19,11 +19,11 @@ __plugin_meta__ = PluginMetadata(
 config = get_plugin_config(Config)
 
 
-key_set = [key for key in CommandStrategy.Command_Map.keys()]
-for c in CommandStrategy.Command_Map.values():
-    key_set += list(c["tags"])
 command_matcher = on_command(
-    "cmd", aliases={v for v in key_set}, priority=config.command_priority, block=True
+    "cmd",
+    aliases=set(CommandStrategy.Command_Index),
+    priority=config.command_priority,
+    block=True,
 )
 
 
@@ -180,6 +180,10 @@ class Calculator:
     def currency_cal(currency_expression: str):
         return str(CurrencyCal(currency_expression))
 
+    @staticmethod
+    async def acurrency_cal(currency_expression: str):
+        return str(await CurrencyCal.acreate(currency_expression))
+
     async def handle_event(self):
         """
         处理事件结果
@@ -1,5 +1,8 @@
 import re
-from src.plugins.command.scr.calculator.forexrate_api import get_rate_data
+from src.plugins.command.scr.calculator.forexrate_api import (
+    get_rate_data,
+    aget_rate_data,
+)
 
 
 class CurrencyParse:
@@ -59,13 +62,23 @@ class CurrencyParse:
         self.currency_code = self.get_currency_code(currency_cur.strip())
 
     def convert(self):
+        if not self.done:
+            raise ValueError("参数错误")
+        return self._convert_with(get_rate_data())
+
+    async def aconvert(self):
+        """`convert`的异步版本, 获取汇率数据时不阻塞事件循环"""
+        if not self.done:
+            raise ValueError("参数错误")
+        return self._convert_with(await aget_rate_data())
+
+    def _convert_with(self, rate_data: dict[str, float] | None):
         if (
             self.original_code is None
             or self.currency_code is None
             or self.price is None
         ):
             raise ValueError("参数错误")
-        rate_data = get_rate_data()
         if not rate_data:
             return "获取汇率失败，请稍后重试"
         CHY_to_original_rate = rate_data.get(self.original_code)
@@ -81,12 +94,15 @@ class CurrencyParse:
 
 
 class CurrencyCal:
-    def __init__(self, currency_expression: str) -> None:
+    def __init__(self, currency_expression: str, *, lazy: bool = False) -> None:
+        """
+        - lazy: 为`True`时不立即换算, 由调用方`await acalculate()`
+        """
         self.currency_parse = CurrencyParse(currency_expression)
         self._result = ""
         if not self.currency_parse.done:
             self._result = f"表达式解析失败，请检查换算表达式。\n解析结果: {self.currency_parse.original_code}>{self.currency_parse.currency_code}:{self.currency_parse.price}"
-        else:
+        elif not lazy:
             self.calculate()
 
     def __str__(self) -> str:
@@ -95,3 +111,14 @@ class CurrencyCal:
     def calculate(self):
         # TODO: 添加货币计算逻辑
         self._result = self.currency_parse.convert()
+
+    async def acalculate(self):
+        self._result = await self.currency_parse.aconvert()
+
+    @classmethod
+    async def acreate(cls, currency_expression: str) -> "CurrencyCal":
+        """创建并异步完成换算"""
+        currency_cal = cls(currency_expression, lazy=True)
+        if currency_cal.currency_parse.done:
+            await currency_cal.acalculate()
+        return currency_cal
@@ -1,3 +1,4 @@
+import asyncio
 import time
 from typing import TypedDict, Optional
 import typing
@@ -19,6 +20,9 @@ class __Response_data(TypedDict):
     rates: dict[str, float]
 
 
+RATE_DATA_TTL = 864000
+"""汇率数据的有效期(秒)"""
+
 __api_key = DataManager.get("forexrate_api_key")
 __client = Client(__api_key)
 
@@ -30,26 +34,44 @@ def __get_rate() -> __Response_data | None:
         return None
 
 
-def __generate_exchange_rate_data():
+def __fetch_rate_data() -> CurrencyRateData | None:
+    """请求汇率接口, 只做网络请求, 可以在工作线程中调用"""
     rate_data = __get_rate()
     if rate_data:
         rate_data = typing.cast(dict, rate_data)
         del rate_data["success"]
         del rate_data["base"]
-        DataManager.set("currency_rate_data", rate_data)
-    rate_data = typing.cast(CurrencyRateData | None, rate_data)
+    return typing.cast(CurrencyRateData | None, rate_data)
+
+
+def __generate_exchange_rate_data():
+    rate_data = __fetch_rate_data()
+    if rate_data:
+        DataManager.set("currency_rate_data", rate_data, ttl=RATE_DATA_TTL)
     return rate_data
 
 
+def __is_stale(rate_data) -> bool:
+    """
+    数据不存在或已过期
+    旧版本写入的数据没有 TTL, 需要按数据自带的时间戳判断
+    """
+    return rate_data == "null" or time.time() - rate_data["timestamp"] > RATE_DATA_TTL
+
+
 def get_rate_data() -> dict[str, float] | None:
     rate_data = DataManager.get("currency_rate_data", "null")
-    if rate_data == "null":
+    if __is_stale(rate_data):
         rate_data = __generate_exchange_rate_data()
-        if not rate_data:
-            return
+    return rate_data["rates"] if rate_data else None
 
-    data_timestamp = rate_data["timestamp"]
-    now_timestamp = time.time()
-    if now_timestamp - data_timestamp > 864000:
-        rate_data = __generate_exchange_rate_data()
+
+async def aget_rate_data() -> dict[str, float] | None:
+    """`get_rate_data`的异步版本, 读取数据与请求汇率接口都不阻塞事件循环"""
+    rate_data = await DataManager.aget("currency_rate_data", "null")
+    if __is_stale(rate_data):
+        # 只有网络请求放到线程中, DataManager 的缓存只能在事件循环中修改
+        rate_data = await asyncio.to_thread(__fetch_rate_data)
+        if rate_data:
+            DataManager.set("currency_rate_data", rate_data, ttl=RATE_DATA_TTL)
     return rate_data["rates"] if rate_data else None
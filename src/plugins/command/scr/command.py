@@ -1,4 +1,5 @@
 import re
+from functools import cached_property
 from html import escape, unescape
 
 from nonebot.adapters.onebot.v11.event import (
@@ -34,25 +35,18 @@ def is_private_message(cmd: "Command") -> TypeGuard["Command[PrivateMessageEvent
 
 
 class Command(Generic[T]):
-    Command_Pattern = r"^/(\w+)(?:@(\w+))?(?: (.+))?$"
+    Command_Pattern = re.compile(r"^/(\w+)(?:@(\w+))?(?: (.+))?$")
+    """`/命令[@功能词][ 参数]`, 模块载入时编译一次"""
 
     def get_args(self, message: str):
         if not message.startswith("/"):
             return None
-        match = re.match(self.Command_Pattern, message)
+        match = self.Command_Pattern.match(message)
         if not match:
             return None
         command, guide, args = match.groups()
         _pure = args.strip() if args else None
-        if not command:
-            return None
-        if (
-            isinstance(command, str)
-            and isinstance(guide, str | None)
-            and isinstance(args, str | None)
-        ):
-            args = args.split() if args else []
-            return command, guide, args, _pure
+        return command, guide, args.split() if args else [], _pure
 
     def __init__(self, bot: Bot, data: T) -> None:
         self.bot = bot
@@ -63,14 +57,6 @@ class Command(Generic[T]):
             [],
             None,
         )
-        self.at_list: list[dict[str, str | None]] = []
-        at_list = data.original_message.get("at")
-        for at in at_list:
-            item: dict[str, str | None] = {
-                "id": at.data.get("id"),
-                "name": at.data.get("name"),
-            }
-            self.at_list.append(item)
 
         text = unescape(data.original_message.extract_plain_text())
 
@@ -79,6 +65,14 @@ class Command(Generic[T]):
             return
         self.command, self.guide, self.args, self.pure = get_args
 
+    @cached_property
+    def at_list(self) -> list[dict[str, str | None]]:
+        """消息中@的人, 只有用到时才从消息中提取"""
+        return [
+            {"id": at.data.get("id"), "name": at.data.get("name")}
+            for at in self.data.original_message.get("at")
+        ]
+
     async def send(self, result: CMDResult | Message | MessageSegment | str):
         if not isinstance(result, CMDResult):  # 如果不是CMDResult则可以直接发送
             if isinstance(result, str):
@@ -218,7 +212,7 @@ class CommandStrategy:
             and cmd.pure
         ):
             # 将货币逻辑交给计算器类，通过计算器类，转到货币计算器类
-            currency = Calculator.currency_cal(cmd.pure)
+            currency = await Calculator.acurrency_cal(cmd.pure)
             await cmd.send(str(currency))
             return
         elif cmd.guide == None and len(cmd.args) > 0:
@@ -301,13 +295,22 @@ class CommandStrategy:
 
     @classmethod
     def get_command(cls, command: str) -> tuple[str, CommandItem] | None:
-        strategy = CommandStrategy.Command_Map.get(command)
-        if strategy:
-            return command, strategy
-        else:
-            for cmd, item in CommandStrategy.Command_Map.items():
-                if command in item["tags"]:
-                    return cmd, item
+        return cls.Command_Index.get(command)
+
+    @classmethod
+    def build_index(cls):
+        """由`Command_Map`构建命令名与别名的索引, 修改`Command_Map`后需要重新构建"""
+        index: dict[str, tuple[str, CommandItem]] = {}
+        for name, item in cls.Command_Map.items():
+            for tag in item["tags"]:
+                index.setdefault(tag, (name, item))
+        # 命令名优先于其他命令的同名别名
+        for name, item in cls.Command_Map.items():
+            index[name] = (name, item)
+        cls.Command_Index = index
+
+    Command_Index: dict[str, tuple[str, CommandItem]] = {}
+    """命令名与别名 -> (命令名, 命令)"""
 
     Command_Map: dict[str, CommandItem] = {
         "help": {
@@ -351,3 +354,6 @@ class CommandStrategy:
             "desc": "猜测缩写意思\n格式: `/sx <缩写>` 或者 `/sx <含缩写的句子>`\n例如: `/sx lsp` => ['老色批', '恋尸癖', ...']",
         },
     }
+
+
+CommandStrategy.build_index()
@@ -61,16 +61,27 @@ class HolidayCalculation:
             return None, holiday_name
 
     @classmethod
-    def get_holiday(cls, date_str: str | None = None):
-        parser = DateParser()
-        date = parser(date_str).date()
-        date_value, date_name = cls.__get_holiday(date)
-        if date_value is None:
-            if date_name:
-                return f"{date_value}是调休日! 它是为了{date_name}调休哒~"
-            return f"{date_value}不是节假日哦。"
-        else:
-            return f"{date_value}就是节假日了哦，这一天是{date_name}~"
+    def get_holiday(
+        cls, date: str | datetime.date | None = None, including_weekends: bool = True
+    ) -> str | None:
+        """
+        ### 某一天是不是节假日
+        - date: 日期或日期文本, 默认为今天
+        - including_weekends: 为`False`时普通的双休日返回`None`
+        """
+        if not isinstance(date, datetime.date):
+            date = DateParser()(date).date()
+        on_holiday, holiday_name = calendar.get_holiday_detail(date)
+        date_text = date.strftime("%Y年%m月%d日")
+        if holiday_name:
+            holiday_name = Holiday_Name[holiday_name]
+            if on_holiday:
+                return f"{date_text}就是节假日了哦，这一天是{holiday_name}~"
+            # 节假日名称不为空但需要上班, 是为节假日补的工作日
+            return f"{date_text}是调休日! 它是为了{holiday_name}调休哒~"
+        if on_holiday:
+            return f"{date_text}是双休日哦~" if including_weekends else None
+        return f"{date_text}不是节假日哦。"
 
     @classmethod
     def __get_next_holiday(
@@ -128,6 +128,7 @@ class DiceAction:
                 continue
             elif token == "-":
                 symbol = "-"
+                continue
             elif "d" not in token:
                 self._box.append((int(token), symbol))
                 continue
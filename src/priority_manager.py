@@ -1,7 +1,7 @@
 from typing import TYPE_CHECKING, Literal
 
 if TYPE_CHECKING:
-    PluginsName = Literal["chat", "command", "mini_game"]
+    PluginsName = Literal["chat", "chat_context", "command", "mini_game"]
 
 
 class PriorityManager:
@@ -19,6 +19,7 @@ class PriorityManager:
             self._initialized = True
             self.priority: dict["PluginsName", int] = {
                 "chat": 99,
+                "chat_context": 100,
                 "command": 0,
                 "mini_game": 50,
             }